@@ -7,13 +7,22 @@ Unified Fedora Pi 4 Forge (offline + first-boot stages)
 See top of file for usage and intent.
 """
 
-import argparse, subprocess, sys, os, shutil
+import argparse, subprocess, sys, os, shutil, threading
 from pathlib import Path
+# json, concurrent.futures, tempfile and urllib are firstboot-only: imported where used so
+# `offline` (and --help) don't pay for them at startup
 
-def sh(cmd, check=True):
+def sh(cmd, check=True, cwd=None, env=None):
     if isinstance(cmd, str):
-        return subprocess.run(cmd, shell=True, check=check)
-    return subprocess.run(cmd, check=check)
+        raise TypeError(f"sh() takes an argv list, not a shell string: {cmd!r}")
+    # CPython only takes its posix_spawn (vfork) path for an executable with a directory part,
+    # close_fds=False and no cwd: resolve bare names up front (argv[0] itself is left as given).
+    # Python's own fds are non-inheritable (PEP 446), so close_fds=False leaks nothing of ours.
+    exe = shutil.which(cmd[0]) if os.sep not in cmd[0] else None
+    r = subprocess.run(cmd, executable=exe, cwd=cwd, env=env, close_fds=False)
+    if check and r.returncode:
+        raise subprocess.CalledProcessError(r.returncode, cmd)
+    return r
 
 def banner(msg):
     print("\n" + "="*80)
@@ -32,73 +41,279 @@ dtoverlay=upstream-pi4
 
 [all]
 """
+DEFAULT_CONFIG_BYTES = DEFAULT_CONFIG_TXT.encode()
+
+SCRIPT_PATH = Path(__file__).resolve()
+SCRIPT_NAME = SCRIPT_PATH.name
+IS_ROOT = os.geteuid() == 0
 
 def stage_offline(args):
     banner("STAGE A: OFFLINE USB FORGE")
-    if os.geteuid() != 0:
+    if not IS_ROOT:
         sys.exit("Run as root")
 
     if args.stage_bootstrap:
         data = Path("/mnt/data/bootstrap")
         data.mkdir(parents=True, exist_ok=True)
-        dst = data / Path(__file__).name
-        shutil.copy2(__file__, dst)
-        os.chmod(dst, 0o755)
-        print(f"Bootstrap staged at {dst}")
+        dst = data / SCRIPT_NAME
+        src_st = os.stat(SCRIPT_PATH)
+        try:
+            dst_st = os.stat(dst)
+        except FileNotFoundError:
+            dst_st = None
+        # copystat keeps mtime, so same size + mtime (or running from the staged copy itself) means up to date
+        if dst_st and (os.path.samefile(SCRIPT_PATH, dst) or
+                       (dst_st.st_size == src_st.st_size and dst_st.st_mtime_ns == src_st.st_mtime_ns)):
+            print(f"Bootstrap already staged at {dst}")
+        else:
+            # in-kernel copy (sendfile may stop short, so loop), synced before copystat stamps the mtime
+            with open(SCRIPT_PATH, "rb") as fs, open(dst, "wb") as fd:
+                off = 0
+                while off < src_st.st_size:
+                    n = os.sendfile(fd.fileno(), fs.fileno(), off, src_st.st_size - off)
+                    if not n:
+                        break
+                    off += n
+                os.fdatasync(fd.fileno())
+            shutil.copystat(SCRIPT_PATH, dst)
+            os.chmod(dst, 0o755)
+            print(f"Bootstrap staged at {dst}")
 
     efi = Path("/boot/efi")
     if efi.exists():
-        (efi / "config.txt").write_text(DEFAULT_CONFIG_TXT)
+        # boot-critical: one write, fsync the file and the directory entry before we report success
+        fd = os.open(efi / "config.txt", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, DEFAULT_CONFIG_BYTES)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        dfd = os.open(efi, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
         print("Wrote safe Pi4 UEFI config.txt")
 
+# Everything firstboot needs, installed by one dnf run up front (one metadata load, one depsolve)
+CORE_PKGS = [
+    "git","rsync","curl","wget","tmux","neovim",
+    "btrfs-progs","btop","mosh","nmap","firewall-config"
+]
+ALL_PKGS = ["langpacks-en_GB","snapper",*CORE_PKGS]
+ARGON_PKGS = ["git","gcc","make","i2c-tools","libi2c-devel"]
+STARSHIP_PKGS = ["zsh","starship"]  # starship rides the main transaction where a repo carries it
+OPTIONAL_PKGS = {"starship"}  # may be in no repo: starship_zsh falls back to the upstream installer
+
+def missing_pkgs(pkgs):
+    # One local rpmdb query; a provider may print several lines, so match the misses by name
+    out = subprocess.run(["rpm","-q","--whatprovides",*pkgs],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    prefix = "no package provides "
+    missing = {l[len(prefix):].strip() for l in out.splitlines() if l.startswith(prefix)}
+    return [p for p in pkgs if p in missing]
+
+# Completed firstboot steps, so a re-run on a provisioned box is a few stat()s instead of subprocesses
+STATE = Path("/var/lib/mash/firstboot.state")
+_STATE_LOCK = threading.Lock()
+
+def load_state():
+    import json
+    try:
+        return json.loads(STATE.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_state(state, **done):
+    import json
+    # helpers finish on different threads: serialize the update and replace atomically
+    with _STATE_LOCK:
+        state.update(done)
+        STATE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = STATE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, STATE)
+
+def once(state, name, fn, verify=None):
+    if state.get(name):
+        print(f"{name}: already done, skipping")
+        return
+    fn()
+    # best-effort helpers swallow their own failures: only record what can be checked on disk
+    if verify is not None and not verify():
+        print(f"{name}: not confirmed, will retry on the next run")
+        return
+    save_state(state, **{name: True})
+
+def dnf_opts(cacheonly=False):
+    # -C only on request (--cacheonly): firstboot runs a single dnf, which must see fresh metadata
+    opts = ["--setopt=install_weak_deps=False"]
+    if cacheonly:
+        opts.append("-C")
+    return opts
+
+def dnf_install(*pkgs, check=True, cacheonly=False):
+    return sh(["dnf","install","-y","--skip-unavailable",*dnf_opts(cacheonly),*pkgs], check=check)
+
+def dnf_has_shell():
+    # dnf4 only: on dnf5 systems /usr/bin/dnf resolves to dnf5, which has no shell
+    path = shutil.which("dnf")
+    return bool(path) and not os.path.basename(os.path.realpath(path)).startswith("dnf5")
+
+class DnfSession:
+    """One `dnf shell` process fed over stdin: queued installs commit as a single transaction on exit."""
+    def __init__(self, *opts):
+        self.opts = opts
+
+    def __enter__(self):
+        self.p = subprocess.Popen(["dnf","shell","-y",*self.opts], stdin=subprocess.PIPE, text=True)
+        return self
+
+    def install(self, *pkgs):
+        self.p.stdin.write(f"install {' '.join(pkgs)}\n")
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.p.stdin.write("run\n")
+        self.p.stdin.write("exit\n")
+        self.p.stdin.close()
+        rc = self.p.wait()
+        if exc_type is None and rc:
+            raise subprocess.CalledProcessError(rc, self.p.args)
+
+def install_all_packages(args, state):
+    pkgs = list(ALL_PKGS)
+    if args.argon_one:
+        pkgs += ARGON_PKGS
+    if args.starship:
+        pkgs += STARSHIP_PKGS
+    pkgs = list(dict.fromkeys(pkgs))
+    if set(pkgs) <= set(state.get("packages", [])):
+        print("packages: already done, skipping")
+        return
+    need = missing_pkgs(pkgs)
+    if not need:
+        print("All firstboot packages already installed")
+    elif dnf_has_shell():
+        with DnfSession("--setopt=strict=False", *dnf_opts(args.cacheonly)) as s:
+            s.install(*need)
+    else:
+        dnf_install(*need, cacheonly=args.cacheonly)
+    # dnf shell can log a failed depsolve/run and still exit 0: trust the rpmdb, not the exit code,
+    # and only record what is really there
+    still = set(missing_pkgs(need)) if need else set()
+    save_state(state, packages=sorted((set(pkgs) - still) | set(state.get("packages", []))))
+    required = sorted(still - OPTIONAL_PKGS)
+    if required:
+        raise RuntimeError(f"dnf did not install: {' '.join(required)}")
+
+def _file_has(path, needle):
+    try:
+        return needle in Path(path).read_text()
+    except OSError:
+        return False
+
 def locale_uk():
-    sh(["dnf","install","-y","langpacks-en_GB"])
-    sh(["localectl","set-locale","LANG=en_GB.UTF-8"])
-    sh(["localectl","set-x11-keymap","gb"])
+    # langpacks-en_GB comes with install_all_packages; skip each localectl round trip
+    # when localed's config files already say what we'd set
+    if not _file_has("/etc/locale.conf", "LANG=en_GB.UTF-8"):
+        sh(["localectl","set-locale","LANG=en_GB.UTF-8"])
+    if not _file_has("/etc/X11/xorg.conf.d/00-keyboard.conf", '"XkbLayout" "gb"'):
+        sh(["localectl","set-x11-keymap","gb"])
+
+SNAPPER_ROOT_CONFIG = Path("/etc/snapper/configs/root")
 
 def snapper_init(user):
-    sh(["dnf","install","-y","snapper"], check=False)
+    if SNAPPER_ROOT_CONFIG.exists():
+        print("snapper root config already present")
+        return
     sh(["snapper","-c","root","create-config","/"], check=False)
     sh(["chmod","a+rx","/.snapshots"], check=False)
     sh(["chown",f":{user}","/.snapshots"], check=False)
 
 def firewall_sane():
     sh(["systemctl","enable","--now","firewalld"])
-    sh(["firewall-cmd","--permanent","--add-service=ssh"])
-    sh(["firewall-cmd","--permanent","--add-service=mosh"], check=False)
+    # one DBus session for both services; if mosh isn't a known service, still insist on ssh
+    if sh(["firewall-cmd","--permanent","--add-service=ssh","--add-service=mosh"], check=False).returncode:
+        sh(["firewall-cmd","--permanent","--add-service=ssh"])
     sh(["firewall-cmd","--reload"])
 
-def packages_core():
-    pkgs = [
-        "git","rsync","curl","wget","tmux","neovim",
-        "btrfs-progs","btop","mosh","nmap","firewall-config"
-    ]
-    sh(["dnf","install","-y","--skip-unavailable",*pkgs])
+def clone_argononed():
+    if not Path("/opt/argononed").exists():
+        # build from the tip only: no history needed
+        sh(["git","clone","--depth=1","--single-branch",
+            "https://gitlab.com/DarkElvenAngel/argononed.git","/opt/argononed"], check=False)
+
+ARGONONED_UNIT = Path("/etc/systemd/system/argononed.service")
 
 def argon_one():
     banner("Argon One V2 (best effort)")
-    sh(["dnf","install","-y","git","gcc","make","i2c-tools","libi2c-devel"], check=False)
-    if not Path("/opt/argononed").exists():
-        sh(["git","clone","https://gitlab.com/DarkElvenAngel/argononed.git","/opt/argononed"], check=False)
-    sh(["bash","-lc","cd /opt/argononed && ./install.sh"], check=False)
+    if ARGONONED_UNIT.exists():
+        print("argononed already installed")
+        return
+    clone_argononed()
+    # no login shell: explicit system PATH instead of sourcing /etc/profile{,.d/*}
+    sh(["./install.sh"], cwd="/opt/argononed", env={**os.environ, "PATH": "/usr/sbin:/usr/bin"}, check=False)
+
+def starship_done(user):
+    return bool(shutil.which("starship")) and _file_has(f"/home/{user}/.zshrc", "starship init zsh")
 
 def starship_zsh(user):
-    sh(["dnf","install","-y","zsh"], check=False)
-    sh(["bash","-lc","curl -fsSL https://starship.rs/install.sh | sh -s -- -y"], check=False)
+    if not shutil.which("starship"):
+        # no RPM: fetch the upstream installer in-process and run it (no curl, no pipe)
+        import http.client, tempfile, urllib.request
+        fd, path = tempfile.mkstemp(suffix=".sh")
+        try:
+            # only a complete download gets run (as root): a truncated script never does
+            complete = False
+            with os.fdopen(fd, "wb") as out:
+                try:
+                    with urllib.request.urlopen("https://starship.rs/install.sh", timeout=60) as r:
+                        shutil.copyfileobj(r, out)
+                    complete = True
+                except (OSError, http.client.HTTPException) as e:
+                    print(f"starship download failed: {e}")
+            # via sh rather than exec: /tmp may be mounted noexec
+            if complete:
+                sh(["sh", path, "-y"], check=False)
+        finally:
+            os.unlink(path)
     z = Path(f"/home/{user}/.zshrc")
     if z.exists() and "starship init zsh" not in z.read_text():
-        z.write_text(z.read_text() + '\n' + 'eval "$(starship init zsh)"\n')
+        # append the ~30 bytes instead of rewriting the whole rc file
+        with z.open("a") as f:
+            f.write('\neval "$(starship init zsh)"\n')
 
 def stage_firstboot(args):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
     banner("STAGE B: FIRST BOOT CONFIG")
-    locale_uk()
-    snapper_init(args.user)
-    firewall_sane()
-    packages_core()
+    state = load_state()
+    # name -> (step, check that it really took effect; None: the step raises on failure)
+    steps = {"locale_uk": (locale_uk, None),
+             "snapper_init": (lambda: snapper_init(args.user), SNAPPER_ROOT_CONFIG.exists),
+             "firewall_sane": (firewall_sane, None)}
     if args.argon_one:
-        argon_one()
+        steps["argon_one"] = (argon_one, ARGONONED_UNIT.exists)
     if args.starship:
-        starship_zsh(args.user)
+        steps["starship_zsh"] = (lambda: starship_zsh(args.user), lambda: starship_done(args.user))
+    failed = []
+    # one pool for the whole stage: the argononed clone (gitlab) overlaps the dnf transaction
+    # (mirrors) when git is already there, then every step fans out once dnf is done
+    with ThreadPoolExecutor(max_workers=len(steps)) as ex:
+        clone = None
+        if args.argon_one and not state.get("argon_one") and shutil.which("git"):
+            clone = ex.submit(clone_argononed)
+        install_all_packages(args, state)
+        if clone:
+            clone.result()
+        # localectl only talks to systemd-localed; nothing here reads the new LANG, so it can overlap too.
+        # Let every step finish, then report all failures together (failed steps stay unrecorded for a re-run)
+        futs = {ex.submit(once, state, name, fn, verify): name for name, (fn, verify) in steps.items()}
+        for f in as_completed(futs):
+            if f.exception() is not None:
+                failed.append(f"{futs[f]}: {f.exception()}")
+    if failed:
+        sys.exit("Firstboot steps failed:\n  " + "\n  ".join(failed))
     banner("DONE")
 
 def main():
@@ -114,6 +329,7 @@ def main():
     fb.add_argument("--user", default="DrTweak")
     fb.add_argument("--argon-one", action="store_true")
     fb.add_argument("--starship", action="store_true")
+    fb.add_argument("--cacheonly", action="store_true", help="dnf -C: metadata already warm, skip the refresh")
 
     args = ap.parse_args()
     if args.mode == "offline":
@@ -20,39 +20,62 @@ Common options:
 from __future__ import annotations
 
 import argparse
+import functools
+import math
 import os
+import platform
 import shlex
 import subprocess
 import sys
+import time
 from dataclasses import dataclass
-from typing import List, Set
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    import dnf  # python3-dnf (dnf4 API); absent on dnf5-only installs
+    import dnf.exceptions
+except ImportError:
+    dnf = None
 
 
 def sh(cmd: List[str], check: bool = True) -> subprocess.CompletedProcess:
     return subprocess.run(cmd, check=check)
 
 
+def spawn(argv: List[str]) -> int:
+    """
+    Run a trivial one-shot command via posix_spawn (vfork+exec on glibc) and return its exit code.
+    Use subprocess where output needs capturing or piping.
+    """
+    pid = os.posix_spawnp(argv[0], argv, os.environ)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
 def banner(msg: str) -> None:
-    print("\n" + "=" * 80)
-    print(msg)
-    print("=" * 80)
+    rule = "=" * 80
+    sys.stdout.write(f"\n{rule}\n{msg}\n{rule}\n")
+    sys.stdout.flush()  # dnf & co. write straight to the terminal
+
+
+@functools.lru_cache(maxsize=1)
+def installed_set() -> frozenset:
+    """
+    Names of every installed RPM from one `rpm -qa` (instead of one `rpm -q` per package).
+    Call installed_set.cache_clear() after anything that changes the rpmdb.
+    """
+    out = subprocess.check_output(["rpm", "-qa", "--qf", "%{NAME}\\n"], text=True)
+    return frozenset(out.split())
 
 
 def is_installed_rpm(pkg: str) -> bool:
-    return subprocess.call(["rpm", "-q", pkg], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+    return pkg in installed_set()
 
 
 def dedupe_keep_order(items: List[str]) -> List[str]:
-    seen: Set[str] = set()
-    out: List[str] = []
-    for x in items:
-        x = x.strip()
-        if not x or x.startswith("#"):
-            continue
-        if x not in seen:
-            seen.add(x)
-            out.append(x)
-    return out
+    # dicts keep insertion order, so fromkeys dedupes in C
+    stripped = (x.strip() for x in items)
+    return list(dict.fromkeys(x for x in stripped if x and not x.startswith("#")))
 
 
 @dataclass
@@ -60,6 +83,85 @@ class Category:
     name: str
     pkgs: List[str]
 
+    @functools.cached_property
+    def deduped(self) -> List[str]:
+        return dedupe_keep_order(self.pkgs)
+
+
+REPOS_DIR = "/etc/yum.repos.d"
+
+
+class DnfSession:
+    """
+    One dnf.Base for the whole run: repo metadata is parsed and the sack filled once,
+    instead of on every `dnf install`. Reloads only if the repo config changes
+    (e.g. after installing RPM Fusion release packages).
+    """
+
+    def __init__(self) -> None:
+        self._base = None
+        self._repos_mtime: Optional[int] = None
+        self._stale = False
+
+    def _load(self):
+        mtime = os.stat(REPOS_DIR).st_mtime_ns
+        if self._base is not None and mtime != self._repos_mtime:
+            self.close()
+        if self._base is None:
+            base = dnf.Base()
+            base.conf.read()
+            base.conf.install_weak_deps = True
+            base.conf.assumeyes = True
+            base.read_all_repos()
+            base.fill_sack(load_system_repo=True)
+            self._base, self._repos_mtime = base, mtime
+        elif self._stale:
+            # our own transaction moved the rpmdb on: refill from the already-loaded repos
+            self._base.reset(goal=True, sack=True)
+            self._base.fill_sack(load_system_repo=True)
+        self._stale = False
+        return self._base
+
+    def install(self, pkgs: List[str], *, allow_erasing: bool = False) -> None:
+        base = self._load()
+        for pkg in pkgs:
+            try:
+                base.install(pkg)
+            except dnf.exceptions.MarkingError:
+                print(f"⚠️ Skipping unavailable package: {pkg}")  # --skip-unavailable
+        try:
+            base.resolve(allow_erasing=allow_erasing)
+            if not base.transaction:
+                return
+            to_fetch = list(base.transaction.install_set)
+            base.download_packages(to_fetch)
+            for po in to_fetch:
+                # same as `dnf -y`: import a missing repo key, refuse a bad signature
+                code, msg = base.package_signature_check(po)
+                if code == 1:
+                    base.package_import_key(po, askcb=lambda *_: True)
+                elif code != 0:
+                    raise dnf.exceptions.Error(msg)
+            base.do_transaction()
+        finally:
+            self._stale = True
+
+    def close(self) -> None:
+        if self._base is not None:
+            self._base.close()
+            self._base = None
+
+
+@functools.lru_cache(maxsize=1)
+def dnf_session() -> DnfSession:
+    return DnfSession()
+
+
+def rpmdb_changed() -> None:
+    """Something outside the session (dnf CLI) changed the rpmdb: drop every cached view of it."""
+    installed_set.cache_clear()
+    dnf_session().close()
+
 
 def dnf_install(pkgs: List[str], *, allow_erasing: bool = False, dry_run: bool = False) -> None:
     pkgs = dedupe_keep_order(pkgs)
@@ -81,15 +183,55 @@ def dnf_install(pkgs: List[str], *, allow_erasing: bool = False, dry_run: bool =
         print("DRY-RUN:", " ".join(shlex.quote(c) for c in cmd))
         return
 
-    sh(cmd, check=True)
+    if dnf is not None:
+        dnf_session().install(to_install, allow_erasing=allow_erasing)
+    else:
+        sh(cmd, check=True)
+    installed_set.cache_clear()
 
 
-def dnf_upgrade(*, dry_run: bool = False) -> None:
-    cmd = ["dnf", "upgrade", "--refresh", "-y"]
+def dnf_prefetch(pkgs: List[str], *, dry_run: bool = False) -> Optional[subprocess.Popen]:
+    """
+    Start `dnf install --downloadonly` for pkgs in the background and return the process
+    (None if there is nothing to fetch). Best-effort: the real install re-resolves anyway.
+    """
+    to_fetch = [p for p in dedupe_keep_order(pkgs) if not is_installed_rpm(p)]
+    if not to_fetch:
+        return None
+    cmd = ["dnf", "install", "--downloadonly", "-y", "-q", "--skip-unavailable", *to_fetch]
+    if dry_run:
+        print("DRY-RUN (background):", " ".join(shlex.quote(c) for c in cmd))
+        return None
+    print(f"⬇️  Prefetching {len(to_fetch)} pkgs in the background ...")
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+
+
+METADATA_MAX_AGE = 24 * 3600
+
+
+DNF_CACHE_DIRS = (Path("/var/cache/dnf"), Path("/var/cache/libdnf5"))  # dnf4, dnf5
+
+
+def metadata_age() -> float:
+    """
+    Seconds since repo metadata was last downloaded (inf if there is none), from the repos'
+    repodata/repomd.xml. Not *.solv: @System.solv is rewritten after every rpmdb change.
+    """
+    repomds = (p for d in DNF_CACHE_DIRS for p in d.glob("*/repodata/repomd.xml"))
+    return min((time.time() - p.stat().st_mtime for p in repomds), default=math.inf)
+
+
+def dnf_upgrade(*, force_refresh: bool = False, dry_run: bool = False) -> None:
+    cmd = ["dnf", "upgrade", "-y"]
+    if force_refresh or metadata_age() >= METADATA_MAX_AGE:
+        cmd.insert(2, "--refresh")
+    else:
+        print("✅ Repo metadata is less than 24h old; upgrading without --refresh.")
     if dry_run:
         print("DRY-RUN:", " ".join(shlex.quote(c) for c in cmd))
         return
     sh(cmd, check=True)
+    rpmdb_changed()
 
 
 def ensure_root() -> None:
@@ -98,11 +240,28 @@ def ensure_root() -> None:
         sys.exit(1)
 
 
+def fedora_release() -> str:
+    """Fedora release number from os-release (what `rpm -E %fedora` reports), without a fork."""
+    try:
+        return platform.freedesktop_os_release()["VERSION_ID"]
+    except (AttributeError, OSError, KeyError):
+        # Python < 3.10 or an odd os-release: parse it by hand, then ask rpm as a last resort
+        for path in ("/etc/os-release", "/usr/lib/os-release"):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.startswith("VERSION_ID="):
+                            return line.split("=", 1)[1].strip().strip('"')
+            except OSError:
+                continue
+        return subprocess.check_output(["rpm", "-E", "%fedora"], text=True).strip()
+
+
 def enable_rpmfusion(with_tainted: bool, dry_run: bool) -> None:
     banner("Repos: RPM Fusion (free + nonfree)")
     free_rel = "rpmfusion-free-release"
     nonfree_rel = "rpmfusion-nonfree-release"
-    fed = subprocess.check_output(["rpm", "-E", "%fedora"], text=True).strip()
+    fed = fedora_release()
 
     if is_installed_rpm(free_rel) and is_installed_rpm(nonfree_rel):
         print("✅ RPM Fusion release packages already installed.")
@@ -116,6 +275,7 @@ def enable_rpmfusion(with_tainted: bool, dry_run: bool) -> None:
             print("DRY-RUN:", " ".join(shlex.quote(c) for c in cmd))
         else:
             sh(cmd, check=True)
+            rpmdb_changed()
 
     if with_tainted:
         banner("Repos: RPM Fusion tainted (for libdvdcss etc.)")
@@ -139,11 +299,11 @@ def setup_snapper(username: str, dry_run: bool = False) -> None:
         return
 
     # Create config (safe if already exists)
-    subprocess.run(["snapper", "-c", "root", "create-config", "/"], check=False)
+    spawn(["snapper", "-c", "root", "create-config", "/"])
 
     # Make snapshots dir browsable and allow your user group to access (best-effort)
-    subprocess.run(["chmod", "a+rx", "/.snapshots"], check=False)
-    subprocess.run(["chown", f":{username}", "/.snapshots"], check=False)
+    spawn(["chmod", "a+rx", "/.snapshots"])
+    spawn(["chown", f":{username}", "/.snapshots"])
 
 
 def setup_uk_locale(dry_run: bool = False) -> None:
@@ -158,8 +318,9 @@ def setup_uk_locale(dry_run: bool = False) -> None:
         return
 
     subprocess.run(["dnf", "install", "-y", "langpacks-en_GB"], check=False)
-    subprocess.run(["localectl", "set-locale", "LANG=en_GB.UTF-8"], check=False)
-    subprocess.run(["localectl", "set-x11-keymap", "gb"], check=False)
+    rpmdb_changed()
+    spawn(["localectl", "set-locale", "LANG=en_GB.UTF-8"])
+    spawn(["localectl", "set-x11-keymap", "gb"])
 
 
 def mount_data_partition(username: str, dry_run: bool = False) -> None:
@@ -178,26 +339,32 @@ def mount_data_partition(username: str, dry_run: bool = False) -> None:
 
     os.makedirs("/data", exist_ok=True)
 
-    # Append to /etc/fstab only if it's not already present (by mountpoint or label)
+    # Append to /etc/fstab only if it's not already present (by mountpoint or label);
+    # one fd for the check and the append, so nothing can slip in between
+    fd = os.open("/etc/fstab", os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
     try:
-        with open("/etc/fstab", "r", encoding="utf-8") as f:
-            fstab = f.read()
-    except Exception:
-        fstab = ""
+        fstab = os.read(fd, os.fstat(fd).st_size)
+        if b"/data" not in fstab and b"LABEL=DATA" not in fstab:
+            if fstab and not fstab.endswith(b"\n"):
+                os.write(fd, b"\n")
+            os.write(fd, fstab_line.encode())
+    finally:
+        os.close(fd)
 
-    if ("/data" not in fstab) and ("LABEL=DATA" not in fstab):
-        with open("/etc/fstab", "a", encoding="utf-8") as f_append:
-            f_append.write(fstab_line)
-
-    subprocess.run(["mount", "-a"], check=False)
-    subprocess.run(["chown", f"{username}:{username}", "/data"], check=False)
+    spawn(["mount", "-a"])
+    spawn(["chown", f"{username}:{username}", "/data"])
 
 
 def maybe_switch_ffmpeg(dry_run: bool) -> None:
+    """
+    Swap ffmpeg-free for RPM Fusion ffmpeg as its own small --allowerasing transaction,
+    so the big merged transaction never gets licence to erase anything.
+    """
     banner("Media: Ensure ffmpeg from RPM Fusion (swap from ffmpeg-free if needed)")
     if is_installed_rpm("ffmpeg-free") and not is_installed_rpm("ffmpeg"):
         print("⚠️ Detected ffmpeg-free; switching to RPM Fusion ffmpeg with --allowerasing ...")
         dnf_install(["ffmpeg"], allow_erasing=True, dry_run=dry_run)
+        installed_set.cache_clear()
     else:
         print("✅ ffmpeg swap not needed.")
 
@@ -212,23 +379,22 @@ def enable_services(dry_run: bool) -> None:
         if dry_run:
             print("DRY-RUN:", " ".join(shlex.quote(c) for c in cmd))
         else:
-            subprocess.run(cmd, check=False)
+            spawn(cmd)
 
     banner("Firewall: allow mosh (best-effort)")
     if dry_run:
         print("DRY-RUN: firewall-cmd --permanent --add-service=mosh && firewall-cmd --reload")
         return
-    subprocess.run(["firewall-cmd", "--permanent", "--add-service=mosh"], check=False)
-    subprocess.run(["firewall-cmd", "--reload"], check=False)
+    spawn(["firewall-cmd", "--permanent", "--add-service=mosh"])
+    spawn(["firewall-cmd", "--reload"])
 
 
 def print_summary(categories: List[Category]) -> None:
     banner("Summary: Categories & package counts (deduped)")
     all_pkgs: List[str] = []
     for cat in categories:
-        pkgs = dedupe_keep_order(cat.pkgs)
-        all_pkgs.extend(pkgs)
-        print(f"- {cat.name}: {len(pkgs)} pkgs")
+        all_pkgs.extend(cat.deduped)
+        print(f"- {cat.name}: {len(cat.deduped)} pkgs")
     print(f"\nTotal (pre-skip-installed): {len(dedupe_keep_order(all_pkgs))} pkgs")
 
 
@@ -237,7 +403,9 @@ def main() -> int:
 
     ap = argparse.ArgumentParser(description="MASH Bootstrap (Fedora) — master list installer.")
     ap.add_argument("--user", default="DrTweak", help="Primary username/group for ownership (default: DrTweak)")
-    ap.add_argument("--no-upgrade", action="store_true", help="Skip dnf upgrade --refresh")
+    ap.add_argument("--no-upgrade", action="store_true", help="Skip dnf upgrade")
+    ap.add_argument("--force-refresh", action="store_true",
+                    help="Always pass --refresh to dnf upgrade (default: only if metadata is >24h old)")
     ap.add_argument("--no-rpmfusion", action="store_true", help="Do NOT install/enable RPM Fusion repos")
     ap.add_argument("--with-tainted", action="store_true", help="Enable RPM Fusion tainted repos (libdvdcss etc.)")
     ap.add_argument("--with-kodi", action="store_true", help="Install Kodi + key addons")
@@ -341,16 +509,24 @@ def main() -> int:
     if not args.no_rpmfusion:
         enable_rpmfusion(with_tainted=args.with_tainted, dry_run=args.dry_run)
 
-    if not args.no_upgrade:
-        banner("System update: dnf upgrade --refresh")
-        dnf_upgrade(dry_run=args.dry_run)
-
+    # one dnf transaction for every category: one metadata load, one depsolve, one rpm commit
+    all_pkgs: List[str] = []
     for cat in categories:
-        banner(f"Install: {cat.name}")
+        print(f"📦 Queued: {cat.name}")
         if cat.name == "Media: Kodi stack":
             maybe_switch_ffmpeg(dry_run=args.dry_run)
-        dnf_install(cat.pkgs, dry_run=args.dry_run)
+        all_pkgs.extend(cat.deduped)
 
+    if not args.no_upgrade:
+        # fetch the install set's RPMs while the upgrade runs, so the install below hits the cache
+        prefetch = dnf_prefetch(all_pkgs, dry_run=args.dry_run)
+        banner("System update: dnf upgrade")
+        dnf_upgrade(force_refresh=args.force_refresh, dry_run=args.dry_run)
+        if prefetch is not None:
+            prefetch.wait()
+
+    banner("Install: all categories (single dnf transaction)")
+    dnf_install(all_pkgs, dry_run=args.dry_run)
 
     if not args.no_data_mount:
         mount_data_partition(args.user, dry_run=args.dry_run)
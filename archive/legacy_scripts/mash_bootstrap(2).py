@@ -24,12 +24,30 @@ Common:
 from __future__ import annotations
 
 import argparse
+import functools
+import glob
+import grp
 import os
+import pwd
 import shlex
+import shutil
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Set
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+try:
+    import rpm  # python3-rpm: query the rpmdb in-process instead of forking /usr/bin/rpm
+except ImportError:
+    rpm = None
+
+try:
+    import dnf  # python3-dnf (dnf4 API); absent on dnf5-only installs
+    import dnf.exceptions
+except ImportError:
+    dnf = None
 
 
 def sh(cmd: List[str], check: bool = True) -> subprocess.CompletedProcess:
@@ -42,21 +60,44 @@ def banner(msg: str) -> None:
     print("=" * 80)
 
 
+@functools.lru_cache(maxsize=1)
+def installed_set() -> frozenset:
+    """
+    Names of every installed RPM from one `rpm -qa` (instead of one `rpm -q` per package).
+    Call installed_set.cache_clear() after anything that changes the rpmdb.
+    """
+    if rpm is not None:
+        return frozenset(h[rpm.RPMTAG_NAME] for h in rpm.TransactionSet().dbMatch())
+    out = subprocess.check_output(["rpm", "-qa", "--qf", "%{NAME}\\n"], text=True)
+    return frozenset(out.split())
+
+
 def is_installed_rpm(pkg: str) -> bool:
-    return subprocess.call(["rpm", "-q", pkg], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+    return pkg in installed_set()
+
+
+def not_installed(pkgs: List[str]) -> List[str]:
+    """
+    pkgs the rpmdb doesn't satisfy, in order. Exact names are checked against installed_set();
+    the rest go through one `rpm -q --whatprovides` so virtual provides count as installed too.
+    """
+    rest = [p for p in pkgs if not is_installed_rpm(p)]
+    if not rest:
+        return []
+    if rpm is not None:
+        ts = rpm.TransactionSet()
+        return [p for p in rest if not len(ts.dbMatch("providename", p))]
+    r = subprocess.run(["rpm", "-q", "--whatprovides", *rest],
+                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    prefix = "no package provides "
+    missing = {line[len(prefix):].strip() for line in r.stdout.splitlines() if line.startswith(prefix)}
+    return [p for p in rest if p in missing]
 
 
 def dedupe_keep_order(items: List[str]) -> List[str]:
-    seen: Set[str] = set()
-    out: List[str] = []
-    for x in items:
-        x = x.strip()
-        if not x or x.startswith("#"):
-            continue
-        if x not in seen:
-            seen.add(x)
-            out.append(x)
-    return out
+    # dicts keep insertion order, so fromkeys dedupes in C
+    stripped = (x.strip() for x in items)
+    return list(dict.fromkeys(x for x in stripped if x and not x.startswith("#")))
 
 
 @dataclass
@@ -64,37 +105,155 @@ class Category:
     name: str
     pkgs: List[str]
 
+    def __post_init__(self) -> None:
+        # cleaned once here; summary and install both use it as-is
+        self.pkgs = dedupe_keep_order(self.pkgs)
 
-def dnf_pkg_available(pkg: str) -> bool:
-    """Best-effort check whether *a package name* exists in enabled repos."""
-    # dnf5 usually has repoquery; if not, we just return True and let --skip-unavailable handle it.
+
+# Every name probed with dnf_pkg_available(); all answered by one repoquery.
+AVAILABILITY_PROBES = ["snapper-plugins", "starship"]
+
+
+@functools.lru_cache(maxsize=None)
+def dnf_pkgs_available(pkgs: Tuple[str, ...]) -> Optional[FrozenSet[str]]:
+    """
+    Names from pkgs found in the enabled repos, via a single `dnf repoquery` (one metadata load).
+    None if repoquery can't be run -- callers then assume available and let --skip-unavailable cope.
+    """
     try:
         r = subprocess.run(
-            ["dnf", "-q", "repoquery", "--latest-limit", "1", pkg],
-            stdout=subprocess.DEVNULL,
+            ["dnf", "-q", "repoquery", "--latest-limit", "1", "--qf", "%{name}\\n", *pkgs],
+            stdout=subprocess.PIPE,
             stderr=subprocess.DEVNULL,
+            text=True,
         )
-        return r.returncode == 0
-    except FileNotFoundError:
-        return True
     except Exception:
-        return True
+        return None
+    if r.returncode != 0:
+        return None
+    return frozenset(r.stdout.split())
+
+
+def dnf_pkg_available(pkg: str) -> bool:
+    """Best-effort check whether *a package name* exists in enabled repos."""
+    probes = tuple(dict.fromkeys([*AVAILABILITY_PROBES, pkg]))
+    available = dnf_pkgs_available(probes)
+    return available is None or pkg in available
+
+
+REPOS_DIR = "/etc/yum.repos.d"
+
+
+class DnfSession:
+    """
+    One dnf.Base for the whole run: repo metadata is parsed and the sack filled once,
+    instead of on every `dnf` invocation. Reloads only if the repo config changes
+    (e.g. after installing RPM Fusion release packages).
+    """
+
+    def __init__(self) -> None:
+        self._base = None
+        self._repos_mtime: Optional[int] = None
+        self._refreshed = False
+        self._stale = False
+
+    def _load(self, refresh: bool):
+        mtime = os.stat(REPOS_DIR).st_mtime_ns
+        if self._base is not None and (mtime != self._repos_mtime or (refresh and not self._refreshed)):
+            self.close()
+        if self._base is None:
+            base = dnf.Base()
+            base.conf.read()
+            base.conf.install_weak_deps = True
+            base.conf.assumeyes = True
+            base.read_all_repos()
+            if refresh:
+                for repo in base.repos.iter_enabled():
+                    repo.metadata_expire = 0  # same as --refresh
+            base.fill_sack(load_system_repo=True)
+            self._base, self._repos_mtime, self._refreshed = base, mtime, refresh
+        elif self._stale:
+            # our own transaction moved the rpmdb on: refill from the already-loaded repos
+            self._base.reset(goal=True, sack=True)
+            self._base.fill_sack(load_system_repo=True)
+        self._stale = False
+        return self._base
+
+    def run(self, pkgs: List[str], *, upgrade: bool = False, refresh: bool = False,
+            allow_erasing: bool = False) -> None:
+        base = self._load(refresh)
+        if upgrade:
+            base.upgrade_all()
+        for pkg in pkgs:
+            try:
+                base.install(pkg)
+            except dnf.exceptions.MarkingError:
+                print(f"⚠️ Skipping unavailable package: {pkg}")  # --skip-unavailable
+        try:
+            base.resolve(allow_erasing=allow_erasing)
+            if not base.transaction:
+                print("✅ Nothing to do.")
+                return
+            to_fetch = list(base.transaction.install_set)
+            base.download_packages(to_fetch)
+            for po in to_fetch:
+                # same as `dnf -y`: import a missing repo key, refuse a bad signature
+                code, msg = base.package_signature_check(po)
+                if code == 1:
+                    base.package_import_key(po, askcb=lambda *_: True)
+                elif code != 0:
+                    raise dnf.exceptions.Error(msg)
+            base.do_transaction()
+        finally:
+            self._stale = True
+
+    def close(self) -> None:
+        if self._base is not None:
+            self._base.close()
+            self._base = None
+
+
+@functools.lru_cache(maxsize=1)
+def dnf_session() -> DnfSession:
+    return DnfSession()
+
+
+def rpmdb_changed() -> None:
+    """Something outside the session (dnf CLI) changed the rpmdb: drop every cached view of it."""
+    installed_set.cache_clear()
+    if dnf is not None:
+        dnf_session().close()
+
+
+# dnf5 reads drop-ins from here; dnf4 has no conf.d, so it keeps getting the flags per call
+DNF_DROPIN = "/etc/dnf/libdnf5.conf.d/20-mash.conf"
+DNF_DEFAULTS = "[main]\ninstall_weak_deps=True\nskip_unavailable=True\n"
+
+
+def write_dnf_defaults(dry_run: bool = False) -> None:
+    """Make weak deps + skip-unavailable dnf5's defaults once, instead of passing them on every call."""
+    if dnf_has_shell():
+        return
+    if dry_run:
+        print(f"DRY-RUN: write {DNF_DROPIN}: {DNF_DEFAULTS!r}")
+        return
+    os.makedirs(os.path.dirname(DNF_DROPIN), exist_ok=True)
+    with open(DNF_DROPIN, "w", encoding="utf-8") as f:
+        f.write(DNF_DEFAULTS)
 
 
 def dnf_install(pkgs: List[str], *, allow_erasing: bool = False, dry_run: bool = False) -> None:
     pkgs = dedupe_keep_order(pkgs)
 
     # Filter already-installed to avoid noisy "already installed" transaction failures on some setups.
-    to_install = [p for p in pkgs if not is_installed_rpm(p)]
+    to_install = not_installed(pkgs)
     if not to_install:
         print("✅ Nothing new to install in this step.")
         return
 
-    cmd = [
-        "dnf", "install", "-y",
-        "--skip-unavailable",
-        "--setopt=install_weak_deps=True",
-    ]
+    cmd = ["dnf", "install", "-y"]
+    if not os.path.exists(DNF_DROPIN):
+        cmd += ["--skip-unavailable", "--setopt=install_weak_deps=True"]
     if allow_erasing:
         cmd.append("--allowerasing")
     cmd.extend(to_install)
@@ -103,15 +262,109 @@ def dnf_install(pkgs: List[str], *, allow_erasing: bool = False, dry_run: bool =
         print("DRY-RUN:", " ".join(shlex.quote(c) for c in cmd))
         return
 
+    if dnf is not None:
+        dnf_session().run(to_install, allow_erasing=allow_erasing)
+        installed_set.cache_clear()
+        return
     sh(cmd, check=True)
+    rpmdb_changed()
+
+
+METADATA_MAX_AGE = 3600
+REPOMD_GLOBS = ("/var/cache/dnf/*/repodata/repomd.xml", "/var/cache/libdnf5/*/repodata/repomd.xml")  # dnf4, dnf5
+
+
+def refresh_args() -> List[str]:
+    """
+    ["--refresh"] unless repo metadata was downloaded within METADATA_MAX_AGE
+    (a re-run shortly after a previous one needn't re-download every repo's metadata).
+    The signal is the newest repodata/repomd.xml mtime: only a metadata download rewrites it,
+    unlike the cache dir itself or its *.solv files, which every local install touches.
+    """
+    mtimes = []
+    for path in (p for pattern in REPOMD_GLOBS for p in glob.glob(pattern)):
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except FileNotFoundError:
+            pass
+    if mtimes and time.time() - max(mtimes) < METADATA_MAX_AGE:
+        print("✅ dnf metadata refreshed within the last hour; skipping --refresh.")
+        return []
+    return ["--refresh"]
 
 
 def dnf_upgrade(*, dry_run: bool = False) -> None:
-    cmd = ["dnf", "upgrade", "--refresh", "-y"]
+    cmd = ["dnf", "upgrade", *refresh_args(), "-y"]
     if dry_run:
         print("DRY-RUN:", " ".join(shlex.quote(c) for c in cmd))
         return
+    if dnf is not None:
+        dnf_session().run([], upgrade=True, refresh="--refresh" in cmd)
+        installed_set.cache_clear()
+        return
     sh(cmd, check=True)
+    rpmdb_changed()
+
+
+def dnf_has_shell() -> bool:
+    """dnf4 has `dnf shell`; on dnf5 systems /usr/bin/dnf resolves to dnf5, which doesn't."""
+    path = shutil.which("dnf")
+    return bool(path) and not os.path.basename(os.path.realpath(path)).startswith("dnf5")
+
+
+def dnf_upgrade_and_install(pkgs: List[str], *, allow_erasing: bool = False, dry_run: bool = False) -> None:
+    """
+    Upgrade + install as one transaction: one metadata load, one depsolve, one rpm lock.
+    Uses the dnf Python API if present, else `dnf shell`; falls back to dnf_upgrade() then
+    dnf_install() where there is neither (dnf5).
+    """
+    if dnf is not None and not dry_run:
+        to_install = not_installed(dedupe_keep_order(pkgs))
+        dnf_session().run(to_install, upgrade=True, refresh=bool(refresh_args()), allow_erasing=allow_erasing)
+        installed_set.cache_clear()
+        return
+
+    if not dnf_has_shell():
+        dnf_upgrade(dry_run=dry_run)
+        dnf_install(pkgs, allow_erasing=allow_erasing, dry_run=dry_run)
+        return
+
+    to_install = not_installed(dedupe_keep_order(pkgs))
+    script = "upgrade\n"
+    if to_install:
+        script += "install " + " ".join(to_install) + "\n"
+    script += "run\n"
+
+    # strict=False is dnf4's spelling of --skip-unavailable
+    cmd = ["dnf", "shell", "-y", *refresh_args(), "--setopt=strict=False", "--setopt=install_weak_deps=True"]
+    if allow_erasing:
+        cmd.append("--allowerasing")
+
+    if dry_run:
+        print("DRY-RUN:", " ".join(shlex.quote(c) for c in cmd), "<<EOF")
+        print(script + "EOF")
+        return
+
+    subprocess.run(cmd, input=script, text=True, check=True)
+    rpmdb_changed()
+
+
+def chown_best_effort(path: str, user: Optional[str], group: Optional[str]) -> None:
+    """os.chown by name instead of forking chown(1); a missing user/group is reported, not fatal."""
+    try:
+        uid = pwd.getpwnam(user).pw_uid if user else -1
+        gid = grp.getgrnam(group).gr_gid if group else -1
+        os.chown(path, uid, gid)
+    except (KeyError, OSError) as e:
+        print(f"⚠️ chown {path} skipped: {e}")
+
+
+def chmod_add_best_effort(path: str, bits: int) -> None:
+    """Like `chmod a+rx` (bits=0o555): add permission bits, keep the rest."""
+    try:
+        os.chmod(path, os.stat(path).st_mode | bits)
+    except OSError as e:
+        print(f"⚠️ chmod {path} skipped: {e}")
 
 
 def ensure_root() -> None:
@@ -124,11 +377,12 @@ def enable_rpmfusion(with_tainted: bool, dry_run: bool) -> None:
     banner("Repos: RPM Fusion (free + nonfree)")
     free_rel = "rpmfusion-free-release"
     nonfree_rel = "rpmfusion-nonfree-release"
-    fed = subprocess.check_output(["rpm", "-E", "%fedora"], text=True).strip()
 
     if is_installed_rpm(free_rel) and is_installed_rpm(nonfree_rel):
         print("✅ RPM Fusion release packages already installed.")
     else:
+        # only needed to build the URLs
+        fed = subprocess.check_output(["rpm", "-E", "%fedora"], text=True).strip()
         urls = [
             f"https://download1.rpmfusion.org/free/fedora/rpmfusion-free-release-{fed}.noarch.rpm",
             f"https://download1.rpmfusion.org/nonfree/fedora/rpmfusion-nonfree-release-{fed}.noarch.rpm",
@@ -138,6 +392,7 @@ def enable_rpmfusion(with_tainted: bool, dry_run: bool) -> None:
             print("DRY-RUN:", " ".join(shlex.quote(c) for c in cmd))
         else:
             sh(cmd, check=True)
+            rpmdb_changed()
 
     if with_tainted:
         banner("Repos: RPM Fusion tainted (for libdvdcss etc.)")
@@ -145,10 +400,15 @@ def enable_rpmfusion(with_tainted: bool, dry_run: bool) -> None:
 
 
 def maybe_switch_ffmpeg(dry_run: bool) -> None:
+    """
+    Swap ffmpeg-free for RPM Fusion ffmpeg as its own small --allowerasing transaction,
+    so the big merged transaction never gets licence to erase anything.
+    """
     banner("Media: Ensure ffmpeg from RPM Fusion (swap from ffmpeg-free if needed)")
     if is_installed_rpm("ffmpeg-free") and not is_installed_rpm("ffmpeg"):
         print("⚠️ Detected ffmpeg-free; switching to RPM Fusion ffmpeg with --allowerasing ...")
         dnf_install(["ffmpeg"], allow_erasing=True, dry_run=dry_run)
+        installed_set.cache_clear()
     else:
         print("✅ ffmpeg swap not needed.")
 
@@ -175,9 +435,9 @@ def setup_snapper(user: str, dry_run: bool = False) -> None:
         return
 
     subprocess.run(["snapper", "-c", "root", "create-config", "/"], check=False)
-    subprocess.run(["chmod", "a+rx", "/.snapshots"], check=False)
+    chmod_add_best_effort("/.snapshots", 0o555)
     # This expects a group with the same name as the user; if it doesn't exist, it's harmless.
-    subprocess.run(["chown", f":{user}", "/.snapshots"], check=False)
+    chown_best_effort("/.snapshots", None, user)
 
 
 def setup_uk_locale(dry_run: bool = False) -> None:
@@ -188,12 +448,33 @@ def setup_uk_locale(dry_run: bool = False) -> None:
         print("DRY-RUN: localectl set-x11-keymap gb")
         return
     subprocess.run(["dnf", "install", "-y", "langpacks-en_GB"], check=False)
+    rpmdb_changed()
     subprocess.run(["localectl", "set-locale", "LANG=en_GB.UTF-8"], check=False)
     subprocess.run(["localectl", "set-x11-keymap", "gb"], check=False)
 
 
+def _is_mounted(mp: str) -> bool:
+    """One read of /proc/self/mounts instead of asking findmnt/mount."""
+    target = mp.encode()
+    with open("/proc/self/mounts", "rb") as f:
+        return any(line.split()[1] == target for line in f)
+
+
+def _fstab_mounts(txt: bytes) -> Set[bytes]:
+    """Mountpoint field of every fstab entry (so '/data-old' doesn't count as '/data')."""
+    points: Set[bytes] = set()
+    for line in txt.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and not fields[0].startswith(b"#"):
+            points.add(fields[1])
+    return points
+
+
 def mount_data_partition(user: str, dry_run: bool = False) -> None:
     banner("Storage: ensure DATA partition mounted at /data")
+    if _is_mounted("/data"):
+        print("✅ /data already mounted.")
+        return
     fstab_line = "LABEL=DATA  /data  ext4  defaults,noatime  0  2\n"
 
     if dry_run:
@@ -205,27 +486,31 @@ def mount_data_partition(user: str, dry_run: bool = False) -> None:
 
     os.makedirs("/data", exist_ok=True)
     try:
-        with open("/etc/fstab", "r", encoding="utf-8") as f:
+        with open("/etc/fstab", "rb") as f:
             txt = f.read()
     except FileNotFoundError:
-        txt = ""
+        txt = b""
 
-    if "/data" not in txt:
+    if b"/data" not in _fstab_mounts(txt):
         with open("/etc/fstab", "a", encoding="utf-8") as f:
             f.write(fstab_line)
 
     subprocess.run(["mount", "-a"], check=False)
-    subprocess.run(["chown", f"{user}:{user}", "/data"], check=False)
+    chown_best_effort("/data", user, user)
 
 
 def install_starship_fallback(dry_run: bool = False) -> None:
     """If the starship RPM doesn't exist, install via upstream script to /usr/local/bin."""
     banner("Starship: fallback install (upstream)")
-    cmd = ["bash", "-lc", "curl -fsSL https://starship.rs/install.sh | sh -s -- -y -b /usr/local/bin"]
     if dry_run:
-        print("DRY-RUN:", cmd[-1])
+        print("DRY-RUN: curl -fsSL https://starship.rs/install.sh | sh -s -- -y -b /usr/local/bin")
         return
-    subprocess.run(cmd, check=False)
+    # curl piped straight into sh: no login bash (and its profile) in between
+    curl = subprocess.Popen(["curl", "-fsSL", "https://starship.rs/install.sh"], stdout=subprocess.PIPE)
+    installer = subprocess.Popen(["sh", "-s", "--", "-y", "-b", "/usr/local/bin"], stdin=curl.stdout)
+    curl.stdout.close()  # so curl gets SIGPIPE if sh exits early
+    installer.wait()
+    curl.wait()
 
 
 def enable_services(dry_run: bool) -> None:
@@ -250,12 +535,13 @@ def enable_services(dry_run: bool) -> None:
 
 def print_summary(categories: List[Category]) -> None:
     banner("Summary: Categories & package counts (deduped)")
-    all_pkgs: List[str] = []
+    # one ordered set across all categories: per-category counts are what that category adds
+    master: Dict[str, None] = {}
     for cat in categories:
-        pkgs = dedupe_keep_order(cat.pkgs)
-        all_pkgs.extend(pkgs)
-        print(f"- {cat.name}: {len(pkgs)} pkgs")
-    print(f"\nTotal (pre-skip-installed): {len(dedupe_keep_order(all_pkgs))} pkgs")
+        before = len(master)
+        master.update(dict.fromkeys(cat.pkgs))
+        print(f"- {cat.name}: {len(master) - before} pkgs")
+    print(f"\nTotal (pre-skip-installed): {len(master)} pkgs")
 
 
 def main() -> int:
@@ -354,7 +640,14 @@ def main() -> int:
     # (We don't need a separate "with-snapper" category because snapper is initialized before installs.)
     categories = categories
 
+    # a package listed in several categories belongs to the first one only
+    seen: Set[str] = set()
+    for cat in categories:
+        cat.pkgs = [p for p in cat.pkgs if p not in seen]
+        seen.update(cat.pkgs)
+
     print_summary(categories)
+    write_dnf_defaults(dry_run=args.dry_run)
 
     # Early safety + system personalization
     if not args.no_snapper_init:
@@ -367,25 +660,35 @@ def main() -> int:
     if not args.no_rpmfusion:
         enable_rpmfusion(with_tainted=args.with_tainted, dry_run=args.dry_run)
 
-    if not args.no_upgrade:
-        banner("System update: dnf upgrade --refresh")
-        dnf_upgrade(dry_run=args.dry_run)
-
-    # Install per category
+    # one dnf transaction for every category (and the upgrade, where dnf shell exists):
+    # one metadata load, one depsolve, one rpm commit
+    all_pkgs: List[str] = []
     for cat in categories:
-        banner(f"Install: {cat.name}")
+        print(f"📦 Queued: {cat.name}")
         if cat.name == "Media: Kodi stack":
             maybe_switch_ffmpeg(dry_run=args.dry_run)
-        dnf_install(cat.pkgs, dry_run=args.dry_run)
+        all_pkgs.extend(cat.pkgs)
+
+    # /data setup is local-only (fstab + mount, no dnf): do it while the long dnf transaction runs
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        data_fut = None
+        if not args.no_data_mount:
+            data_fut = ex.submit(mount_data_partition, user=args.user, dry_run=args.dry_run)
+
+        if not args.no_upgrade:
+            banner("System update + install: all categories (single dnf transaction)")
+            dnf_upgrade_and_install(all_pkgs, dry_run=args.dry_run)
+        else:
+            banner("Install: all categories (single dnf transaction)")
+            dnf_install(all_pkgs, dry_run=args.dry_run)
 
-        # Handle starship if RPM missing and user wants fallback
-        if cat.name == "QoL & shell" and args.with_starship_fallback:
-            if not is_installed_rpm("starship") and not dnf_pkg_available("starship"):
-                install_starship_fallback(dry_run=args.dry_run)
+        if data_fut is not None:
+            data_fut.result()
 
-    # Storage mount
-    if not args.no_data_mount:
-        mount_data_partition(user=args.user, dry_run=args.dry_run)
+    # Handle starship if RPM missing and user wants fallback
+    if args.with_starship_fallback:
+        if not is_installed_rpm("starship") and not dnf_pkg_available("starship"):
+            install_starship_fallback(dry_run=args.dry_run)
 
     enable_services(dry_run=args.dry_run)
 
@@ -24,9 +24,10 @@ Optional:
   --boot-size 2048MiB
   --root-end 1800GiB          # where partition 3 ends; partition 4 uses the rest
   --no-dracut                 # not recommended
+  --yes                       # skip the YES confirmation before wiping
 
 Requirements:
-  parted, wipefs, mkfs.vfat, mkfs.ext4, mkfs.btrfs, losetup, rsync, blkid, btrfs, dracut, findmnt, udevadm
+  parted, partprobe, wipefs, mkfs.vfat, mkfs.ext4, mkfs.btrfs, losetup, rsync, blkid, btrfs, dracut, findmnt, udevadm
 """
 
 import argparse
@@ -35,34 +36,44 @@ import re
 import shutil
 import subprocess
 import sys
-import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
+# ---------- patterns (compiled once) ----------
+_SIZE_RE = re.compile(r"^(\d+)\s*(MiB|GiB)$", re.I)
+_RSYNC_VER_RE = re.compile(r"version\s+(\d+)\.(\d+)\.(\d+)")
+_SUBVOL_PATH_RE = re.compile(r"\bpath\s+(\S+)$", re.M)
+_OPTS_LINE_RE = re.compile(r"^options .*$", re.M)
+
+
 # ---------- helpers ----------
 def sh(cmd, check=True, capture=False):
-    if isinstance(cmd, str):
-        p = subprocess.run(
-            cmd, shell=True, check=check,
-            stdout=subprocess.PIPE if capture else None,
-            stderr=subprocess.PIPE if capture else None,
-            text=True
-        )
-    else:
-        p = subprocess.run(
-            cmd, shell=False, check=check,
-            stdout=subprocess.PIPE if capture else None,
-            stderr=subprocess.PIPE if capture else None,
-            text=True
-        )
+    # argv lists only (every caller passes one): no per-call str/shell branch
+    p = subprocess.run(
+        cmd, check=check,
+        stdout=subprocess.PIPE if capture else None,
+        stderr=subprocess.PIPE if capture else None,
+        text=True
+    )
     if capture:
         return (p.stdout or "").strip()
     return ""
 
 
-def need(binname: str):
-    if shutil.which(binname) is None:
-        die(f"Missing required command: {binname}")
+def needs(binnames):
+    # list each PATH dir once rather than a which() walk of the whole PATH per command
+    found = set()
+    for d in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        try:
+            found.update(os.listdir(d or "."))
+        except OSError:
+            pass
+    missing = [b for b in binnames if b not in found]
+    if missing:
+        die(f"Missing required command(s): {', '.join(missing)}")
 
 
 def die(msg: str, code: int = 1):
@@ -85,8 +96,23 @@ def umount(path: Path):
     sh(["umount", "-R", str(path)], check=False)
 
 
-def udev_settle():
-    sh(["udevadm", "settle"], check=False)
+def mount_batch(entries):
+    """
+    Mount [(dev, target, fstype, opts), ...] in order with a single `mount -a` over a
+    throwaway fstab, instead of one mount(8) process per entry.
+    """
+    with tempfile.NamedTemporaryFile("w", prefix="ninja-", suffix=".fstab") as f:
+        for dev, target, fstype, opts in entries:
+            f.write(f"{dev} {target} {fstype} {opts} 0 0\n")
+        f.flush()
+        sh(["mount", "-a", "--fstab", f.name])
+
+
+def udev_settle(timeout=None):
+    cmd = ["udevadm", "settle"]
+    if timeout is not None:
+        cmd.append(f"--timeout={timeout}")
+    sh(cmd, check=False)
 
 
 def lsblk_tree(disk: str):
@@ -99,7 +125,7 @@ def blkid_uuid(dev: str) -> str:
 
 def parse_size_to_mib(s: str) -> int:
     s = s.strip()
-    m = re.match(r"^(\d+)\s*(MiB|GiB)$", s, re.I)
+    m = _SIZE_RE.match(s)
     if not m:
         die(f"Size must be like 1024MiB or 2GiB, got: {s}")
     v = int(m.group(1))
@@ -107,48 +133,138 @@ def parse_size_to_mib(s: str) -> int:
     return v if unit == "mib" else v * 1024
 
 
-def rsync_progress(src: Path, dst: Path, desc: str, extra_args=None):
+# copies run side by side: progress lines are whole lines, written one at a time
+_PRINT_LOCK = threading.Lock()
+
+def rsync_version() -> tuple:
+    out = sh(["rsync", "--version"], check=False, capture=True)
+    m = _RSYNC_VER_RE.search(out)
+    return tuple(int(x) for x in m.groups()) if m else (0, 0, 0)
+
+
+def last_pct(buf: bytes):
+    """
+    Newest ' NN%' in raw rsync output as (pct, end): only the last '%' matters, so scan back
+    from it for up to 3 digits -- no decode, no regex. (-1, 0) if there is none yet.
+    """
+    i = buf.rfind(b"%")
+    while i > 0:
+        j = i
+        while j > max(i - 3, 0) and 48 <= buf[j - 1] <= 57:
+            j -= 1
+        if j < i and (j == 0 or buf[j - 1] in b" \t\r\n"):
+            return int(buf[j:i]), i + 1
+        i = buf.rfind(b"%", 0, i)
+    return -1, 0
+
+
+def rsync_progress(src: Path, dst: Path, desc: str, extra_args=None, tag=None):
     extra_args = extra_args or []
-    banner(desc)
-    cmd = ["rsync", "-aHAX", "--numeric-ids", "--info=progress2"] + extra_args + [f"{src}/", f"{dst}/"]
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    tag = tag or desc
+    with _PRINT_LOCK:
+        banner(desc)
+    # -S: zero runs become holes instead of being written out
+    cmd = ["rsync", "-aHAX", "-S", "--numeric-ids", "--info=progress2"] + extra_args + [f"{src}/", f"{dst}/"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
     barw = 28
+    step = 5  # one line per 5% keeps interleaved jobs readable
     last = -1
+    fd = proc.stdout.fileno()
+    buf = b""
     try:
-        for line in proc.stdout:
-            m = re.search(r"\s(\d{1,3})%\s", line)
-            if m:
-                pct = int(m.group(1))
-                if pct != last:
-                    last = pct
-                    filled = int((pct / 100) * barw)
-                    bar = "█" * filled + " " * (barw - filled)
-                    sys.stdout.write(f"\r[{bar}] {pct:3d}%")
-                    sys.stdout.flush()
+        # raw os.read returns whatever the pipe holds: progress shows as it arrives, and the
+        # pipe is drained continuously so rsync never blocks on a full buffer. Only the newest
+        # percentage in each read matters; a str is built only when the bar actually moves.
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            buf += chunk
+            pct, end = last_pct(buf)
+            # keep a short tail so a ' 3' + '7%' split across reads still parses
+            buf = buf[end:][-4096:]
+            if pct < 0:
+                continue
+            pct = pct // step * step
+            if pct != last:
+                last = pct
+                filled = int((pct / 100) * barw)
+                bar = "█" * filled + " " * (barw - filled)
+                with _PRINT_LOCK:
+                    print(f"[{tag}] [{bar}] {pct:3d}%", flush=True)
         rc = proc.wait()
-        if last >= 0:
-            sys.stdout.write("\r" + " " * (barw + 10) + "\r")
         if rc != 0:
             die(f"{desc} failed (exit {rc})")
-        print("✅ Done.")
+        with _PRINT_LOCK:
+            print(f"[{tag}] ✅ Done.")
     finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            # interrupted: let rsync clean up its temp files, kill only if it won't go
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+
+def btrfs_clone_subvol(src_top: Path, dst_top: Path, name: str) -> bool:
+    """
+    Clone subvol <name> from src_top to dst_top via btrfs send | receive (extent streaming,
+    no per-file walk). receive creates dst_top/<name> itself. Returns False, with any partial
+    copy removed, if the stream fails so the caller can fall back to rsync.
+    """
+    snap_dir = src_top / f".ninja_snap_{name}"
+    mkdirp(snap_dir)
+    snap = snap_dir / name
+
+    def drop_snapshot():
+        if snap.exists():
+            sh(["btrfs", "subvolume", "delete", str(snap)], check=False)
         try:
-            proc.kill()
-        except Exception:
+            snap_dir.rmdir()
+        except OSError:
             pass
 
+    # an interrupted earlier run can leave its snapshot behind: clear it first
+    if snap.exists():
+        sh(["btrfs", "subvolume", "delete", str(snap)], check=False)
+    try:
+        sh(["btrfs", "subvolume", "snapshot", "-r", str(src_top / name), str(snap)])
+    except subprocess.CalledProcessError:
+        drop_snapshot()
+        return False
+    try:
+        send = subprocess.Popen(["btrfs", "send", "-q", str(snap)], stdout=subprocess.PIPE)
+        recv = subprocess.Popen(["btrfs", "receive", str(dst_top)], stdin=send.stdout)
+        send.stdout.close()
+        # reap both ends even when receive fails first
+        recv_rc = recv.wait()
+        send_rc = send.wait()
+        if recv_rc != 0 or send_rc != 0:
+            if (dst_top / name).exists():
+                sh(["btrfs", "subvolume", "delete", str(dst_top / name)], check=False)
+            return False
+        # received subvols come back read-only; -f because received_uuid is set
+        sh(["btrfs", "property", "set", "-f", "-ts", str(dst_top / name), "ro", "false"])
+        return True
+    finally:
+        drop_snapshot()
+
 
-def rsync_vfat_safe(src: Path, dst: Path, desc: str, delete=False):
+def rsync_vfat_safe(src: Path, dst: Path, desc: str):
     """
     VFAT cannot chown; do a safe copy with no owners/groups/perms.
+    File data only: copyfile() moves the bytes in-kernel (sendfile), no rsync process.
     """
     banner(desc)
-    cmd = ["rsync", "-rltD", "--no-owner", "--no-group", "--no-perms"]
-    if delete:
-        cmd.append("--delete")
-    cmd += [f"{src}/", f"{dst}/"]
-    sh(cmd, check=True)
+    for root, _dirs, files in os.walk(src):
+        out = dst / os.path.relpath(root, src)
+        mkdirp(out)
+        for name in files:
+            shutil.copyfile(os.path.join(root, name), out / name)
 
 
 def write_file(path: Path, content: str):
@@ -163,22 +279,18 @@ def patch_bls_entries(boot_entries_dir: Path, root_uuid: str):
     bad = []
     touched = 0
     for f in boot_entries_dir.glob("*.conf"):
-        lines = f.read_text().splitlines()
-        new_lines = []
-        for line in lines:
-            if line.startswith("options "):
-                # Force the exact flags that worked manually for you
-                opts = f"root=UUID={root_uuid} rootflags=subvol=root rw rhgb quiet"
-                new_lines.append(f"options {opts}")
-            else:
-                new_lines.append(line)
-        f.write_text("\n".join(new_lines) + "\n")
-        touched += 1
-        # Verify the expected options line is present
         try:
-            if expected not in f.read_text():
-                bad.append(f.name)
-        except Exception:
+            txt = f.read_text()
+            # Force the exact flags that worked manually for you: one sub over the whole file
+            new = _OPTS_LINE_RE.sub(lambda m: expected, txt)
+            if new != txt:
+                f.write_text(new)
+        except OSError:
+            bad.append(f.name)
+            continue
+        touched += 1
+        # Verify the expected options line is present (write_text raises if the write failed)
+        if expected not in new:
             bad.append(f.name)
 
     if touched == 0:
@@ -219,14 +331,14 @@ def main():
     ap.add_argument("--boot-size", default="2048MiB", help="/boot size (default 2048MiB)")
     ap.add_argument("--root-end", default="1800GiB", help="End of ROOT partition (p3). p4 (DATA) uses the rest.")
     ap.add_argument("--no-dracut", action="store_true", help="Skip dracut (not recommended)")
+    ap.add_argument("--yes", action="store_true", help="Erase the disk without the YES prompt (scripted runs)")
     args = ap.parse_args()
 
     image = Path(args.image).resolve()
     disk = args.disk
     uefi_dir = Path(args.uefi_dir).resolve()
 
-    for c in ["parted", "wipefs", "mkfs.vfat", "mkfs.ext4", "mkfs.btrfs", "losetup", "rsync", "blkid", "btrfs", "dracut", "findmnt", "udevadm"]:
-        need(c)
+    needs(["parted", "partprobe", "wipefs", "mkfs.vfat", "mkfs.ext4", "mkfs.btrfs", "losetup", "rsync", "blkid", "btrfs", "dracut", "findmnt", "udevadm"])
 
     if not image.exists():
         die(f"Image not found: {image}")
@@ -282,8 +394,13 @@ def main():
         banner("SAFETY CHECK: ABOUT TO ERASE TARGET DISK (MBR, 4 partitions)")
         lsblk_tree(disk)
         print(f"\nDisk: {disk} | Image: {image.name} | ROOT end: {args.root_end}")
-        print("Ctrl+C now if that's not the right disk.\n")
-        time.sleep(5)
+        if not args.yes:
+            try:
+                answer = input(f"Type YES to erase {disk}: ").strip()
+            except (EOFError, KeyboardInterrupt):
+                answer = ""  # no TTY / closed stdin / Ctrl+C: never a yes
+            if answer != "YES":
+                die("Aborted, nothing touched.")
 
         # ---- unmount anything on disk ----
         banner("Unmounting anything using target disk")
@@ -308,17 +425,19 @@ def main():
         boot_start = efi_end
         boot_end = f"{boot_end_mib}MiB"
 
-        sh(["parted", "-s", disk, "mklabel", "msdos"])
-        sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "fat32", efi_start, efi_end])
-        sh(["parted", "-s", disk, "set", "1", "boot", "on"])
-        sh(["parted", "-s", disk, "set", "1", "lba", "on"])
-
-        sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "ext4", boot_start, boot_end])
-        sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "btrfs", boot_end, args.root_end])
-        sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "ext4", args.root_end, "100%"])
-
-        sh(["parted", "-s", disk, "print"])
-        udev_settle()
+        # one parted run: one device open, one table write, one round of udev events
+        sh(["parted", "-s", "-a", "optimal", disk,
+            "mklabel", "msdos",
+            "mkpart", "primary", "fat32", efi_start, efi_end,
+            "set", "1", "boot", "on",
+            "set", "1", "lba", "on",
+            "mkpart", "primary", "ext4", boot_start, boot_end,
+            "mkpart", "primary", "btrfs", boot_end, args.root_end,
+            "mkpart", "primary", "ext4", args.root_end, "100%",
+            "print"])
+        sh(["partprobe", disk], check=False)
+        # returns as soon as udev has created the p1..p4 nodes
+        udev_settle(timeout=30)
 
         efi_dev = f"{disk}1"
         boot_dev = f"{disk}2"
@@ -347,57 +466,66 @@ def main():
         for sub in ["efi", "boot", "root_top", "root_sub_root", "root_sub_home", "root_sub_var"]:
             mkdirp(SRC / sub)
 
-        sh(["mount", img_efi, str(SRC / "efi")])
-        sh(["mount", img_boot, str(SRC / "boot")])
-        sh(["mount", "-t", "btrfs", img_root, str(SRC / "root_top")])
+        mount_batch([
+            (img_efi, SRC / "efi", "auto", "defaults"),
+            (img_boot, SRC / "boot", "auto", "defaults"),
+            (img_root, SRC / "root_top", "btrfs", "defaults"),
+        ])
 
         subvols = sh(["btrfs", "subvolume", "list", str(SRC / "root_top")], capture=True)
-        has_root = re.search(r"\bpath\s+root$", subvols, re.M) is not None
-        has_home = re.search(r"\bpath\s+home$", subvols, re.M) is not None
-        has_var = re.search(r"\bpath\s+var$", subvols, re.M) is not None
+        subvol_paths = set(_SUBVOL_PATH_RE.findall(subvols))
+        has_root = "root" in subvol_paths
+        has_home = "home" in subvol_paths
+        has_var = "var" in subvol_paths
         if not has_root:
             die("Image does not contain btrfs subvol 'root' (unexpected for Fedora RAW)")
 
-        sh(["mount", "-t", "btrfs", "-o", "subvol=root", img_root, str(SRC / "root_sub_root")])
-        if has_home:
-            sh(["mount", "-t", "btrfs", "-o", "subvol=home", img_root, str(SRC / "root_sub_home")])
-        if has_var:
-            sh(["mount", "-t", "btrfs", "-o", "subvol=var", img_root, str(SRC / "root_sub_var")])
+        mount_batch([(img_root, SRC / f"root_sub_{n}", "btrfs", f"subvol={n}")
+                     for n, present in (("root", True), ("home", has_home), ("var", has_var)) if present])
 
         # ---- mount destinations ----
         banner("Mounting destination partitions")
         for sub in ["efi", "boot", "data", "root_top", "root_sub_root", "root_sub_home", "root_sub_var"]:
             mkdirp(DST / sub)
 
-        sh(["mount", efi_dev, str(DST / "efi")])
-        sh(["mount", boot_dev, str(DST / "boot")])
-        sh(["mount", data_dev, str(DST / "data")])
-        sh(["mount", "-t", "btrfs", root_dev, str(DST / "root_top")])
-
-        # create destination subvols
-        banner("Creating destination btrfs subvols")
-        sh(["btrfs", "subvolume", "create", str(DST / "root_top" / "root")])
-        if has_home:
-            sh(["btrfs", "subvolume", "create", str(DST / "root_top" / "home")])
-        if has_var:
-            sh(["btrfs", "subvolume", "create", str(DST / "root_top" / "var")])
-
-        # mount them for rsync targets
-        sh(["mount", "-t", "btrfs", "-o", "subvol=root", root_dev, str(DST / "root_sub_root")])
-        if has_home:
-            sh(["mount", "-t", "btrfs", "-o", "subvol=home", root_dev, str(DST / "root_sub_home")])
-        if has_var:
-            sh(["mount", "-t", "btrfs", "-o", "subvol=var", root_dev, str(DST / "root_sub_var")])
-
-        # ---- copy btrfs subvols ----
-        rsync_progress(SRC / "root_sub_root", DST / "root_sub_root", "Copying Fedora btrfs subvol: root")
-        if has_home:
-            rsync_progress(SRC / "root_sub_home", DST / "root_sub_home", "Copying Fedora btrfs subvol: home")
-        if has_var:
-            rsync_progress(SRC / "root_sub_var", DST / "root_sub_var", "Copying Fedora btrfs subvol: var")
-
-        # ---- copy /boot partition ----
-        rsync_progress(SRC / "boot", DST / "boot", "Copying Fedora /boot partition -> real /boot (ext4)")
+        mount_batch([
+            (efi_dev, DST / "efi", "vfat", "defaults"),
+            (boot_dev, DST / "boot", "ext4", "defaults"),
+            (data_dev, DST / "data", "ext4", "defaults"),
+            (root_dev, DST / "root_top", "btrfs", "defaults"),
+        ])
+
+        # Targets are fresh, so --inplace is safe; rsync < 3.1.3 refuses it alongside --sparse.
+        # --preallocate (fallocate, fewer btrfs fragments) only combines with --sparse from 3.2.3.
+        rsync_ver = rsync_version()
+        copy_args = ["--inplace"] if rsync_ver >= (3, 1, 3) else []
+        subvol_args = copy_args + (["--preallocate"] if rsync_ver >= (3, 2, 3) else [])
+
+        # ---- clone btrfs subvols (send/receive creates them on the target) + copy /boot ----
+        # Independent streams (three subvols, separate ext4 /boot): run them together so the
+        # loop device's reads and the USB target's writes overlap.
+        names = [n for n, present in (("root", True), ("home", has_home), ("var", has_var)) if present]
+        banner(f"Cloning btrfs subvols ({', '.join(names)}) via send/receive + copying /boot")
+        with ThreadPoolExecutor(max_workers=len(names) + 1) as ex:
+            boot_job = ex.submit(rsync_progress, SRC / "boot", DST / "boot",
+                                 "Copying Fedora /boot partition -> real /boot (ext4)", copy_args, "boot")
+            clones = {n: ex.submit(btrfs_clone_subvol, SRC / "root_top", DST / "root_top", n) for n in names}
+            need_rsync = [n for n, f in clones.items() if not f.result()]
+            boot_job.result()
+
+        for name in need_rsync:
+            print(f"⚠️ btrfs send/receive failed for '{name}'; falling back to rsync.")
+            sh(["btrfs", "subvolume", "create", str(DST / "root_top" / name)])
+
+        # mount them (chroot targets; rsync targets for any fallback)
+        mount_batch([(root_dev, DST / f"root_sub_{n}", "btrfs", f"subvol={n}") for n in names])
+
+        # ---- rsync fallback for subvols send/receive couldn't clone ----
+        if need_rsync:
+            with ThreadPoolExecutor(max_workers=len(need_rsync)) as ex:
+                for f in [ex.submit(rsync_progress, SRC / f"root_sub_{n}", DST / f"root_sub_{n}",
+                                    f"Copying Fedora btrfs subvol: {n}", subvol_args, n) for n in need_rsync]:
+                    f.result()
 
         # ---- mount /boot + /boot/efi inside target root ----
         banner("Mounting /boot and /boot/efi inside target root")
@@ -409,11 +537,11 @@ def main():
         # ---- install Fedora EFI loaders onto EFI ----
         banner("Installing Fedora EFI loaders (EFI/*) onto EFI (FAT32)")
         mkdirp(DST / "efi" / "EFI")
-        rsync_vfat_safe(SRC / "efi" / "EFI", DST / "efi" / "EFI", "Copy Fedora EFI tree to EFI partition", delete=False)
+        rsync_vfat_safe(SRC / "efi" / "EFI", DST / "efi" / "EFI", "Copy Fedora EFI tree to EFI partition")
 
         # ---- install PFTF UEFI onto EFI (LAST) ----
         banner("Installing Pi4 UEFI (PFTF) onto EFI (LAST)")
-        rsync_vfat_safe(uefi_dir, DST / "efi", "Copy PFTF UEFI firmware to EFI partition", delete=False)
+        rsync_vfat_safe(uefi_dir, DST / "efi", "Copy PFTF UEFI firmware to EFI partition")
 
         # ---- write config.txt (PFTF known-good) ----
         banner("Writing Pi4 UEFI config.txt")
@@ -470,11 +598,11 @@ dtoverlay=upstream-pi4
             if has_home:
                 mkdirp(root_path / "home")
 
-# Bind /boot and /boot/efi into the chroot (critical for grub+bls+mkconfig)
-mkdirp(root_path / "boot")
-mkdirp(root_path / "boot" / "efi")
-sh(["mount", "--bind", str(DST / "boot"), str(root_path / "boot")])
-sh(["mount", "--bind", str(DST / "efi"), str(root_path / "boot" / "efi")])
+            # Bind /boot and /boot/efi into the chroot (critical for grub+bls+mkconfig)
+            mkdirp(root_path / "boot")
+            mkdirp(root_path / "boot" / "efi")
+            sh(["mount", "--bind", str(DST / "boot"), str(root_path / "boot")])
+            sh(["mount", "--bind", str(DST / "efi"), str(root_path / "boot" / "efi")])
 
             # Bind the other btrfs subvols into place (important for a sane chroot)
             if has_var:
@@ -517,41 +645,41 @@ sh(["mount", "--bind", str(DST / "efi"), str(root_path / "boot" / "efi")])
             else:
                 print("⚠️ Could not verify password state (passwd -S returned nothing).")
 
-# ---- GRUB (removable) + absolute config + BLS sync ----
-banner("Installing GRUB (removable) + generating config + BLS sync")
-grub_cmd = "grub2-install --target=arm64-efi --efi-directory=/boot/efi --removable --force"
-config_cmd = "grub2-mkconfig -o /boot/grub2/grub.cfg"
-bls_cmd = "grub2-switch-to-blscfg"
-
-sh(["chroot", str(root_path), "sh", "-c", grub_cmd], check=False)
-sh(["chroot", str(root_path), "sh", "-c", config_cmd], check=False)
-sh(["chroot", str(root_path), "sh", "-c", bls_cmd], check=False)
-
-# ---- SELinux + home-dir safety net ----
-banner("SELinux relabel + home directory safety net")
-relabel_cmd = "touch /.autorelabel"
-home_cmd = "mkdir -p /home/drtweak && chown 1000:1000 /home/drtweak"
-
-sh(["chroot", str(root_path), "sh", "-c", relabel_cmd], check=False)
-sh(["chroot", str(root_path), "sh", "-c", home_cmd], check=False)
-
-# ---- Verify GRUB + relabel + home ----
-banner("Verifying GRUB + relabel + home")
-bootaa64 = root_path / "boot" / "efi" / "EFI" / "BOOT" / "BOOTAA64.EFI"
-grubcfg = root_path / "boot" / "grub2" / "grub.cfg"
-autorelabel = root_path / ".autorelabel"
-homedir = root_path / "home" / "drtweak"
-
-print(f"  {'✅' if bootaa64.exists() else '❌'} {bootaa64}")
-print(f"  {'✅' if grubcfg.exists() and grubcfg.stat().st_size > 0 else '❌'} {grubcfg}")
-print(f"  {'✅' if autorelabel.exists() else '❌'} {autorelabel}")
-print(f"  {'✅' if homedir.exists() else '❌'} {homedir}")
-
-if grubcfg.exists():
-    # best-effort sanity: mention if it still looks empty
-    head = grubcfg.read_text(errors="ignore")[:4000]
-    if "menuentry" not in head:
-        print("⚠️ /boot/grub2/grub.cfg does not appear to contain 'menuentry' near the top. If GRUB menu is empty, re-check BLS entries on /boot/loader/entries.")
+            # ---- GRUB (removable) + absolute config + BLS sync ----
+            banner("Installing GRUB (removable) + generating config + BLS sync")
+            grub_cmd = "grub2-install --target=arm64-efi --efi-directory=/boot/efi --removable --force"
+            config_cmd = "grub2-mkconfig -o /boot/grub2/grub.cfg"
+            bls_cmd = "grub2-switch-to-blscfg"
+
+            sh(["chroot", str(root_path), "sh", "-c", grub_cmd], check=False)
+            sh(["chroot", str(root_path), "sh", "-c", config_cmd], check=False)
+            sh(["chroot", str(root_path), "sh", "-c", bls_cmd], check=False)
+
+            # ---- SELinux + home-dir safety net ----
+            banner("SELinux relabel + home directory safety net")
+            relabel_cmd = "touch /.autorelabel"
+            home_cmd = "mkdir -p /home/drtweak && chown 1000:1000 /home/drtweak"
+
+            sh(["chroot", str(root_path), "sh", "-c", relabel_cmd], check=False)
+            sh(["chroot", str(root_path), "sh", "-c", home_cmd], check=False)
+
+            # ---- Verify GRUB + relabel + home ----
+            banner("Verifying GRUB + relabel + home")
+            bootaa64 = root_path / "boot" / "efi" / "EFI" / "BOOT" / "BOOTAA64.EFI"
+            grubcfg = root_path / "boot" / "grub2" / "grub.cfg"
+            autorelabel = root_path / ".autorelabel"
+            homedir = root_path / "home" / "drtweak"
+
+            print(f"  {'✅' if bootaa64.exists() else '❌'} {bootaa64}")
+            print(f"  {'✅' if grubcfg.exists() and grubcfg.stat().st_size > 0 else '❌'} {grubcfg}")
+            print(f"  {'✅' if autorelabel.exists() else '❌'} {autorelabel}")
+            print(f"  {'✅' if homedir.exists() else '❌'} {homedir}")
+
+            if grubcfg.exists():
+                # best-effort sanity: mention if it still looks empty
+                head = grubcfg.read_text(errors="ignore")[:4000]
+                if "menuentry" not in head:
+                    print("⚠️ /boot/grub2/grub.cfg does not appear to contain 'menuentry' near the top. If GRUB menu is empty, re-check BLS entries on /boot/loader/entries.")
 
 
         # ---- final sanity ----
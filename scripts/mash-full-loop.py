@@ -23,7 +23,7 @@ What this script does (the “we learned this the hard way” version):
     p4 DATA (ext4)   opt   -> optional data partition (GPT recommended)
 - Copies Fedora ROOT from image btrfs subvols: root + home + var (no “missing var/home” surprises)
 - Copies Fedora /boot partition from image -> real /boot (so dracut + BLS are sane)
-- Installs Pi4 UEFI firmware (PFTF) onto EFI (vfat-safe rsync: no chown/perms)
+- Installs Pi4 UEFI firmware (PFTF) onto EFI (vfat-safe copy: no chown/perms)
 - Merges Fedora EFI loaders (EFI/BOOT/BOOTAA64.EFI etc.) onto EFI
 - Writes a known-good config.txt for Pi4 UEFI (PFTF)
 - Creates /boot/efi mountpoint and writes UUID-based /etc/fstab
@@ -43,35 +43,67 @@ Notes:
 """
 
 import argparse
+import fcntl
+import functools
 import os
 import re
 import shutil
+import stat
 import subprocess
 import sys
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
+LOOP_SET_DIRECT_IO = 0x4C08
+
+# destination btrfs during the bulk clone: fewer transaction commits, no atime updates.
+# commit/space_cache are per-filesystem, so the root_top mount sets them for every subvol mount.
+BTRFS_CLONE_OPTS = "noatime,commit=120,space_cache=v2"
+
+# --efi-size / --boot-size
+_SIZE_RE = re.compile(r"^(\d+)\s*(MiB|GiB)$", re.I)
+
+# `btrfs subvolume list` lines for the Fedora layout
+_SUBVOL_ROOT_RE = re.compile(r"\bpath\s+root$", re.M)
+_SUBVOL_HOME_RE = re.compile(r"\bpath\s+home$", re.M)
+_SUBVOL_VAR_RE = re.compile(r"\bpath\s+var$", re.M)
+
+# rsync --info=progress2 percentage
+_PROGRESS_RE = re.compile(rb"\s(\d{1,3})%\s")
+
+# BLS "options" rewrites
+_ROOT_UUID_RE = re.compile(r"\broot=UUID=[0-9a-fA-F-]+\b")
+_ROOT_ANY_RE = re.compile(r"\broot=\S+")
+_ROOTFLAGS_RE = re.compile(r"\brootflags=\S+")
+
+
 # ---------- helpers ----------
-def sh(cmd, check=True, capture=False):
+def sh(cmd, check=True, capture=False, quiet=False):
     """
-    Run command. cmd can be list or string.
+    Run command from an argv list (never through /bin/sh).
+    quiet=True sends output to /dev/null (fire-and-forget cleanup commands).
     """
     if isinstance(cmd, str):
-        p = subprocess.run(cmd, shell=True, check=check,
-                           stdout=subprocess.PIPE if capture else None,
-                           stderr=subprocess.PIPE if capture else None,
-                           text=True)
-    else:
-        p = subprocess.run(cmd, shell=False, check=check,
-                           stdout=subprocess.PIPE if capture else None,
-                           stderr=subprocess.PIPE if capture else None,
-                           text=True)
+        raise TypeError(f"sh() takes an argv list, got string: {cmd!r}")
+    sink = subprocess.PIPE if capture else (subprocess.DEVNULL if quiet else None)
+    p = subprocess.run(cmd, check=check, stdout=sink, stderr=sink, text=True)
     if capture:
         return (p.stdout or "").strip()
     return ""
 
 
+@functools.lru_cache(maxsize=64)
+def sh_cached(cmd: tuple) -> str:
+    """
+    Captured output of an idempotent query, memoized on the argv tuple.
+    Call sh_cached.cache_clear() after anything that changes the answer (mkfs).
+    """
+    return sh(list(cmd), capture=True)
+
+
 def need(binname: str):
     if shutil.which(binname) is None:
         die(f"Missing required command: {binname}")
@@ -94,7 +126,7 @@ def mkdirp(p: Path):
 
 
 def umount(path: Path):
-    sh(["umount", "-R", str(path)], check=False)
+    sh(["umount", "-R", str(path)], check=False, quiet=True)
 
 
 def udev_settle():
@@ -105,13 +137,99 @@ def lsblk_tree(disk: str):
     sh(["lsblk", "-o", "NAME,SIZE,TYPE,FSTYPE,MOUNTPOINTS,MODEL", disk], check=False)
 
 
+def disk_mountpoints(disk: str) -> list:
+    """
+    Every mount target backed by disk or one of its partitions, deepest first.
+    Sources are matched against lsblk's own node list for the disk, never by name prefix
+    (/dev/loop1 must not match /dev/loop10, nor /dev/nvme0n1 match /dev/nvme0n10).
+    """
+    nodes = set(sh(["lsblk", "-lnpo", "NAME", disk], capture=True).split())
+    out = sh(["findmnt", "-rno", "SOURCE,TARGET"], capture=True)
+    targets = []
+    for line in out.splitlines():
+        source, _, target = line.partition(" ")
+        source = source.split("[", 1)[0]  # btrfs: /dev/sda3[/root]
+        if source in nodes:
+            targets.append(target.replace("\\x20", " "))
+    return sorted(set(targets), reverse=True)
+
+
+def get_uuids(disk: str) -> dict:
+    """
+    {partition: UUID} for every partition on disk from a single lsblk call.
+    """
+    out = sh_cached(("lsblk", "-nrpo", "NAME,UUID", disk))
+    uuids = {}
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) == 2:
+            uuids[fields[0]] = fields[1]
+    return uuids
+
+
+def mounts_under(*roots: Path) -> list:
+    """Every mount target at or below one of roots, deepest first."""
+    out = sh(["findmnt", "-rno", "TARGET"], capture=True)
+    prefixes = [str(r) for r in roots]
+    targets = [t.replace("\\x20", " ") for t in out.splitlines()]
+    return sorted({t for t in targets if any(t == r or t.startswith(r + "/") for r in prefixes)}, reverse=True)
+
+
 def blkid_uuid(dev: str) -> str:
-    return sh(["blkid", "-s", "UUID", "-o", "value", dev], capture=True)
+    return sh_cached(("blkid", "-s", "UUID", "-o", "value", dev))
+
+
+def losetup_direct_io(image: Path) -> str:
+    """
+    Attach image to a loop device with LO_FLAGS_DIRECT_IO so the one-shot clone reads
+    bypass the page cache. Older util-linux lacks --direct-io; fall back to the ioctl.
+    """
+    p = subprocess.run(["losetup", "--show", "-Pf", "--direct-io=on", str(image)],
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if p.returncode == 0:
+        return p.stdout.strip()
+
+    loopdev = sh(["losetup", "--show", "-Pf", str(image)], capture=True)
+    try:
+        fd = os.open(loopdev, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd, LOOP_SET_DIRECT_IO, 1)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"⚠️  Could not enable direct I/O on {loopdev}: {e} (continuing buffered)")
+    return loopdev
+
+
+def losetup_with_retry(image: Path, tries: int = 5) -> str:
+    """
+    Attach image and wait for the kernel to register the loopNpX partition nodes.
+    Slow media can race the async partition scan, so retry with exponential backoff.
+    """
+    delay = 0.5
+    for attempt in range(1, tries + 1):
+        try:
+            loopdev = losetup_direct_io(image)
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️  losetup failed (attempt {attempt}/{tries}): exit {e.returncode}")
+        else:
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                udev_settle()
+                if Path(f"{loopdev}p1").exists():
+                    return loopdev
+                time.sleep(0.1)
+            print(f"⚠️  {loopdev}p1 never appeared (attempt {attempt}/{tries})")
+            sh(["losetup", "-d", loopdev], check=False, quiet=True)
+        if attempt < tries:
+            time.sleep(delay)
+            delay *= 2
+    die(f"Could not loop-attach {image} after {tries} attempts")
 
 
 def parse_size_to_mib(s: str) -> int:
     s = s.strip()
-    m = re.match(r"^(\d+)\s*(MiB|GiB)$", s, re.I)
+    m = _SIZE_RE.match(s)
     if not m:
         die(f"Size must be like 1024MiB or 2GiB, got: {s}")
     v = int(m.group(1))
@@ -119,19 +237,47 @@ def parse_size_to_mib(s: str) -> int:
     return v if unit == "mib" else v * 1024
 
 
+def rsync_cmd(src: Path, dst: Path, extra_args=None) -> list:
+    # destination is always freshly formatted: no delta engine, no temp-file+rename, fallocate up front
+    return (["rsync", "-aHAX", "--numeric-ids", "--info=progress2",
+             "-W", "--inplace", "--no-compress", "--preallocate"]
+            + (extra_args or []) + [f"{src}/", f"{dst}/"])
+
+
+def rsync_logged(src: Path, dst: Path, desc: str, log_path: Path):
+    """
+    rsync without the progress bar, output to log_path: safe to run several at once.
+    """
+    print(f"🚚 {desc} (log: {log_path})")
+    with open(log_path, "wb") as log:
+        rc = subprocess.run(rsync_cmd(src, dst), stdout=log, stderr=subprocess.STDOUT).returncode
+    if rc != 0:
+        die(f"{desc} failed (exit {rc}, see {log_path})")
+    print(f"✅ {desc}: done.")
+
+
 def rsync_progress(src: Path, dst: Path, desc: str, extra_args=None):
     """
     rsync with a simple progress bar using --info=progress2
     """
-    extra_args = extra_args or []
     banner(desc)
-    cmd = ["rsync", "-aHAX", "--numeric-ids", "--info=progress2"] + extra_args + [f"{src}/", f"{dst}/"]
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    cmd = rsync_cmd(src, dst, extra_args)
+    # stdout only: errors go straight to the terminal instead of through the parser
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0)
     barw = 28
     last = -1
+    tail = b""
     try:
-        for line in proc.stdout:
-            m = re.search(r"\s(\d{1,3})%\s", line)
+        # raw 64KiB reads, scan bytes for the newest "NN%" only (progress2 is \r-terminated)
+        while True:
+            chunk = proc.stdout.read(1 << 16)
+            if not chunk:
+                break
+            buf = tail + chunk
+            tail = buf[-16:]
+            m = None
+            for m in _PROGRESS_RE.finditer(buf):
+                pass
             if m:
                 pct = int(m.group(1))
                 if pct != last:
@@ -147,19 +293,117 @@ def rsync_progress(src: Path, dst: Path, desc: str, extra_args=None):
             die(f"{desc} failed (exit {rc})")
         print("✅ Done.")
     finally:
-        try:
+        proc.stdout.close()
+        if proc.poll() is None:
             proc.kill()
-        except Exception:
+        proc.wait()
+
+
+def _copy_file_data(src: str, dst: str, size: int):
+    with open(src, "rb") as fi, open(dst, "wb") as fo:
+        try:
+            # in-kernel copy: no userspace bounce buffer
+            remaining = size
+            while remaining > 0:
+                n = os.copy_file_range(fi.fileno(), fo.fileno(), remaining)
+                if n == 0:
+                    break
+                remaining -= n
+        except OSError:
+            # e.g. EXDEV on kernels that refuse cross-superblock copies
+            fi.seek(0)
+            fo.seek(0)
+            fo.truncate()
+            shutil.copyfileobj(fi, fo, 1 << 20)
+
+
+def _copy_meta(src: str, dst: str, st: os.stat_result):
+    for key in os.listxattr(src, follow_symlinks=False):
+        try:
+            os.setxattr(dst, key, os.getxattr(src, key, follow_symlinks=False), follow_symlinks=False)
+        except OSError:
+            pass
+    os.chown(dst, st.st_uid, st.st_gid, follow_symlinks=False)
+    if not stat.S_ISLNK(st.st_mode):
+        os.chmod(dst, stat.S_IMODE(st.st_mode))
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+
+
+def fast_copytree(src: Path, dst: Path):
+    """
+    Copy a tree into an empty destination with os.copy_file_range.
+    Keeps what rsync -aAX kept for /boot: modes, owners, times, symlinks, xattrs (SELinux labels).
+    """
+    mkdirp(dst)
+    with os.scandir(src) as it:
+        for e in it:
+            d = os.path.join(dst, e.name)
+            st = e.stat(follow_symlinks=False)
+            if e.is_symlink():
+                os.symlink(os.readlink(e.path), d)
+            elif e.is_dir(follow_symlinks=False):
+                fast_copytree(Path(e.path), Path(d))
+            elif e.is_file(follow_symlinks=False):
+                _copy_file_data(e.path, d, st.st_size)
+            else:
+                continue
+            _copy_meta(e.path, d, st)
+    _copy_meta(str(src), str(dst), os.stat(src, follow_symlinks=False))
+
+
+def btrfs_clone_subvol(src_top: Path, name: str, dst_top: Path) -> bool:
+    """
+    Clone btrfs subvol <name> from src_top into dst_top via btrfs send | btrfs receive.
+    Streams extents instead of walking every inode like rsync does.
+    Returns False if the stream fails (e.g. mixed fs) so the caller can fall back to rsync.
+    """
+    banner(f"Cloning Fedora btrfs subvol: {name} (send/receive)")
+    snap_dir = src_top / f".mash_snap_{name}"  # per-subvol: clones may run concurrently
+    snap = snap_dir / name
+    dst = dst_top / name
+    mkdirp(snap_dir)
+
+    # btrfs send needs a read-only snapshot; receive recreates it under the same name
+    if subprocess.run(["btrfs", "subvolume", "snapshot", "-r", str(src_top / name), str(snap)]).returncode != 0:
+        print(f"⚠️  Could not snapshot subvol '{name}' (falling back to rsync)")
+        return False
+
+    try:
+        send = subprocess.Popen(["btrfs", "send", "-q", str(snap)], stdout=subprocess.PIPE)
+        recv = subprocess.Popen(["btrfs", "receive", str(dst_top)], stdin=send.stdout)
+        send.stdout.close()
+        recv_rc = recv.wait()
+        send_rc = send.wait()
+        if send_rc != 0 or recv_rc != 0:
+            print(f"⚠️  btrfs send/receive failed for '{name}' (send={send_rc}, receive={recv_rc}); falling back to rsync")
+            if dst.exists():
+                sh(["btrfs", "subvolume", "delete", str(dst)], check=False)
+            return False
+
+        # received subvols are read-only; newer btrfs-progs want -f because received_uuid is set
+        if subprocess.run(["btrfs", "property", "set", "-f", "-ts", str(dst), "ro", "false"]).returncode != 0:
+            sh(["btrfs", "property", "set", "-ts", str(dst), "ro", "false"])
+        print("✅ Done.")
+        return True
+    finally:
+        sh(["btrfs", "subvolume", "delete", str(snap)], check=False)
+        try:
+            snap_dir.rmdir()
+        except OSError:
             pass
 
 
 def rsync_vfat_safe(src: Path, dst: Path, desc: str):
     """
-    VFAT cannot chown; do a safe copy with no owners/groups/perms.
+    VFAT cannot chown/chmod; copy file data only (no owners/groups/perms).
+    shutil.copyfile uses sendfile in-kernel, so no rsync startup or per-file protocol overhead.
     """
     banner(desc)
-    cmd = ["rsync", "-rltD", "--delete", "--no-owner", "--no-group", "--no-perms", f"{src}/", f"{dst}/"]
-    sh(cmd, check=True)
+    for root, _dirs, files in os.walk(src):
+        out = dst / os.path.relpath(root, src)
+        mkdirp(out)
+        for name in files:
+            shutil.copyfile(os.path.join(root, name), out / name)
 
 
 def write_file(path: Path, content: str):
@@ -176,40 +420,43 @@ def patch_bls_entries(boot_entries_dir: Path, root_uuid: str):
         print(f"⚠️  No BLS entries dir found: {boot_entries_dir} (skipping BLS patch)")
         return
 
-    files = sorted(boot_entries_dir.glob("*.conf"))
+    with os.scandir(boot_entries_dir) as it:
+        files = [e.path for e in it if e.is_file() and e.name.endswith(".conf")]
     if not files:
         print(f"⚠️  No BLS entry files in {boot_entries_dir} (skipping BLS patch)")
         return
 
     print(f"🩹 Patching BLS entries in {boot_entries_dir} ...")
-    for f in files:
-        txt = f.read_text(encoding="utf-8", errors="ignore").splitlines(True)
-
-        out = []
-        for line in txt:
-            if line.startswith("options "):
-                opts = line[len("options "):].strip()
-
-                # replace root=...
-                if re.search(r"\broot=UUID=[0-9a-fA-F-]+\b", opts):
-                    opts = re.sub(r"\broot=UUID=[0-9a-fA-F-]+\b", f"root=UUID={root_uuid}", opts)
-                elif re.search(r"\broot=[^\s]+\b", opts):
-                    opts = re.sub(r"\broot=[^\s]+\b", f"root=UUID={root_uuid}", opts)
-                else:
-                    opts = f"root=UUID={root_uuid} " + opts
-
-                # ensure rootflags=subvol=root
-                if re.search(r"\brootflags=", opts):
-                    # overwrite whatever is there
-                    opts = re.sub(r"\brootflags=[^\s]+\b", "rootflags=subvol=root", opts)
+    for path in files:
+        # one open per entry: read, patch, rewrite in place only if something changed
+        with open(path, "r+", encoding="utf-8", errors="surrogateescape") as f:
+            data = f.read()
+            out = []
+            for line in data.splitlines(True):
+                if line.startswith("options "):
+                    opts = line[len("options "):].strip()
+
+                    # replace root=...
+                    opts, n = _ROOT_UUID_RE.subn(f"root=UUID={root_uuid}", opts)
+                    if not n:
+                        opts, n = _ROOT_ANY_RE.subn(f"root=UUID={root_uuid}", opts)
+                    if not n:
+                        opts = f"root=UUID={root_uuid} " + opts
+
+                    # ensure rootflags=subvol=root (overwrite whatever is there)
+                    opts, n = _ROOTFLAGS_RE.subn("rootflags=subvol=root", opts)
+                    if not n:
+                        opts = opts + " rootflags=subvol=root"
+
+                    out.append("options " + opts.strip() + "\n")
                 else:
-                    opts = opts + " rootflags=subvol=root"
-
-                out.append("options " + opts.strip() + "\n")
-            else:
-                out.append(line)
+                    out.append(line)
 
-        f.write_text("".join(out), encoding="utf-8")
+            new = "".join(out)
+            if new != data:
+                f.seek(0)
+                f.truncate()
+                f.write(new)
     print("✅ BLS patched.")
 
 
@@ -246,38 +493,25 @@ def main():
     # mount roots
     SRC = Path("/mnt/ninja_src")
     DST = Path("/mnt/ninja_dst")
+    MOUNT_SUBDIRS = ["efi", "boot", "root_top", "root_sub_root", "root_sub_home", "root_sub_var"]
 
     loopdev = None
+    mounts = []
+
+    def mnt(*args, check=True):
+        """mount ... <target>; remember the target so cleanup() only unmounts what we mounted."""
+        rc = subprocess.run(["mount", *map(str, args)], check=check).returncode
+        if rc == 0:
+            mounts.append(Path(args[-1]))
 
     def cleanup():
         nonlocal loopdev
-        # unmount in “reverse annoyances” order
-        for p in [
-            DST / "root" / "boot" / "efi",
-            DST / "efi",
-            DST / "boot",
-            DST / "root",
-            SRC / "root_top",
-            SRC / "root_sub_root",
-            SRC / "root_sub_home",
-            SRC / "root_sub_var",
-            SRC / "boot",
-            SRC / "efi",
-            SRC
-        ]:
-            umount(p)
-        # chroot bind mounts
-        for p in [
-            DST / "root" / "dev" / "pts",
-            DST / "root" / "dev",
-            DST / "root" / "proc",
-            DST / "root" / "sys",
-            DST / "root" / "run",
-            DST / "root" / "tmp"
-        ]:
+        # only undo what we actually mounted, innermost first
+        for p in reversed(mounts):
             umount(p)
+        mounts.clear()
         if loopdev:
-            sh(["losetup", "-d", loopdev], check=False)
+            sh(["losetup", "-d", loopdev], check=False, quiet=True)
             loopdev = None
         udev_settle()
 
@@ -290,10 +524,13 @@ def main():
 
         # ---- unmount anything on disk ----
         banner("Unmounting anything using target disk")
-        mps = sh(["lsblk", "-lnpo", "MOUNTPOINT", disk], capture=True)
-        for mp in [x.strip() for x in mps.splitlines() if x.strip()]:
-            sh(["umount", "-R", mp], check=False)
-        cleanup()
+        targets = disk_mountpoints(disk)
+        if targets:
+            sh(["umount", "-R", "--"] + targets, check=False, quiet=True)
+        # leftovers from an earlier aborted run
+        stale = mounts_under(SRC, DST)
+        if stale:
+            sh(["umount", "-R", "--"] + stale, check=False, quiet=True)
 
         # ---- wipe signatures ----
         banner("Wiping signatures")
@@ -311,26 +548,32 @@ def main():
         boot_start = efi_end
         boot_end = f"{boot_end_mib}MiB"
 
+        # one parted session per scheme: single device open + partition table re-read
+        parted = ["parted", "-s", "-a", "optimal", disk]
         if args.scheme == "gpt":
-            sh(["parted", "-s", disk, "mklabel", "gpt"])
-            sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "fat32", efi_start, efi_end])
-            sh(["parted", "-s", disk, "set", "1", "esp", "on"])
-            sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "ext4", boot_start, boot_end])
+            root_end = "70%" if args.make_data else "100%"
+            parted += [
+                "mklabel", "gpt",
+                "mkpart", "primary", "fat32", efi_start, efi_end,
+                "set", "1", "esp", "on",
+                "mkpart", "primary", "ext4", boot_start, boot_end,
+                "mkpart", "primary", "btrfs", boot_end, root_end,
+            ]
             if args.make_data:
-                sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "btrfs", boot_end, "70%"])
-                sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "ext4", "70%", "100%"])
-            else:
-                sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "btrfs", boot_end, "100%"])
+                parted += ["mkpart", "primary", "ext4", root_end, "100%"]
         else:
             print("⚠️  MBR selected. On many 4TB USB drives this can fail due to msdos limits.")
-            sh(["parted", "-s", disk, "mklabel", "msdos"])
-            sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "fat32", efi_start, efi_end])
-            sh(["parted", "-s", disk, "set", "1", "boot", "on"])
-            sh(["parted", "-s", disk, "set", "1", "lba", "on"])
-            sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "ext4", boot_start, boot_end])
-            sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "btrfs", boot_end, args.mbr_root_end])
+            parted += [
+                "mklabel", "msdos",
+                "mkpart", "primary", "fat32", efi_start, efi_end,
+                "set", "1", "boot", "on",
+                "set", "1", "lba", "on",
+                "mkpart", "primary", "ext4", boot_start, boot_end,
+                "mkpart", "primary", "btrfs", boot_end, args.mbr_root_end,
+            ]
             if args.make_data:
-                sh(["parted", "-s", "-a", "optimal", disk, "mkpart", "primary", "ext4", args.mbr_root_end, "100%"])
+                parted += ["mkpart", "primary", "ext4", args.mbr_root_end, "100%"]
+        sh(parted)
 
         sh(["parted", "-s", disk, "print"])
         udev_settle()
@@ -342,17 +585,25 @@ def main():
 
         # ---- format ----
         banner("Formatting filesystems")
-        sh(["mkfs.vfat", "-F", "32", "-n", "EFI", efi_dev])
-        sh(["mkfs.ext4", "-F", "-L", "BOOT", boot_dev])
-        sh(["mkfs.btrfs", "-f", "-L", "FEDORA", root_dev])
+        mkfs_cmds = [
+            ["mkfs.vfat", "-F", "32", "-n", "EFI", efi_dev],
+            ["mkfs.ext4", "-F", "-L", "BOOT", boot_dev],
+            ["mkfs.btrfs", "-f", "-L", "FEDORA", root_dev],
+        ]
         if data_dev:
-            sh(["mkfs.ext4", "-F", "-L", "DATA", data_dev])
+            mkfs_cmds.append(["mkfs.ext4", "-F", "-L", "DATA", data_dev])
+        # disjoint partitions: let the block layer overlap the zeroing/flushes
+        with ThreadPoolExecutor(max_workers=len(mkfs_cmds)) as ex:
+            for f in [ex.submit(sh, cmd) for cmd in mkfs_cmds]:
+                f.result()
+        sh_cached.cache_clear()  # new filesystems, new UUIDs
 
         udev_settle()
+        uuids = get_uuids(disk)
 
         # ---- loop mount image ----
         banner("Loop-mounting Fedora image")
-        loopdev = sh(["losetup", "--show", "-Pf", str(image)], capture=True)
+        loopdev = losetup_with_retry(image)
         sh(["lsblk", loopdev])
 
         img_efi = f"{loopdev}p1"
@@ -361,67 +612,66 @@ def main():
 
         # ---- mount sources ----
         banner("Mounting image partitions")
-        mkdirp(SRC / "efi")
-        mkdirp(SRC / "boot")
-        mkdirp(SRC / "root_top")
-        mkdirp(SRC / "root_sub_root")
-        mkdirp(SRC / "root_sub_home")
-        mkdirp(SRC / "root_sub_var")
+        # all source + destination mountpoints in one go
+        for base in (SRC, DST):
+            for sub in MOUNT_SUBDIRS:
+                mkdirp(base / sub)
 
-        sh(["mount", img_efi, str(SRC / "efi")])
-        sh(["mount", img_boot, str(SRC / "boot")])
-        sh(["mount", "-t", "btrfs", img_root, str(SRC / "root_top")])
+        mnt(img_efi, SRC / "efi")
+        mnt(img_boot, SRC / "boot")
+        mnt("-t", "btrfs", img_root, SRC / "root_top")
 
         subvols = sh(["btrfs", "subvolume", "list", str(SRC / "root_top")], capture=True)
-        has_root = re.search(r"\bpath\s+root$", subvols, re.M) is not None
-        has_home = re.search(r"\bpath\s+home$", subvols, re.M) is not None
-        has_var = re.search(r"\bpath\s+var$", subvols, re.M) is not None
+        has_root = _SUBVOL_ROOT_RE.search(subvols) is not None
+        has_home = _SUBVOL_HOME_RE.search(subvols) is not None
+        has_var = _SUBVOL_VAR_RE.search(subvols) is not None
         if not has_root:
             die("Image does not contain btrfs subvol 'root' (unexpected for Fedora RAW)")
 
-        sh(["mount", "-t", "btrfs", "-o", "subvol=root", img_root, str(SRC / "root_sub_root")])
+        mnt("-t", "btrfs", "-o", "subvol=root", img_root, SRC / "root_sub_root")
         if has_home:
-            sh(["mount", "-t", "btrfs", "-o", "subvol=home", img_root, str(SRC / "root_sub_home")])
+            mnt("-t", "btrfs", "-o", "subvol=home", img_root, SRC / "root_sub_home")
         if has_var:
-            sh(["mount", "-t", "btrfs", "-o", "subvol=var", img_root, str(SRC / "root_sub_var")])
+            mnt("-t", "btrfs", "-o", "subvol=var", img_root, SRC / "root_sub_var")
 
         # ---- mount destinations ----
         banner("Mounting destination partitions")
-        mkdirp(DST / "efi")
-        mkdirp(DST / "boot")
-        mkdirp(DST / "root_top")
-        mkdirp(DST / "root_sub_root")
-        mkdirp(DST / "root_sub_home")
-        mkdirp(DST / "root_sub_var")
-
-        sh(["mount", efi_dev, str(DST / "efi")])
-        sh(["mount", boot_dev, str(DST / "boot")])
-        sh(["mount", "-t", "btrfs", root_dev, str(DST / "root_top")])
-
-        # create destination subvols to match Fedora layout
-        banner("Creating destination btrfs subvols")
-        sh(["btrfs", "subvolume", "create", str(DST / "root_top" / "root")])
-        if has_home:
-            sh(["btrfs", "subvolume", "create", str(DST / "root_top" / "home")])
-        if has_var:
-            sh(["btrfs", "subvolume", "create", str(DST / "root_top" / "var")])
+        mnt(efi_dev, DST / "efi")
+        mnt(boot_dev, DST / "boot")
+        mnt("-t", "btrfs", "-o", BTRFS_CLONE_OPTS, root_dev, DST / "root_top")
+
+        # ---- clone root subvols ----
+        # btrfs send | receive creates the destination subvols itself; rsync is only the fallback
+        def clone_subvol(name: str, log: Path = None):
+            dst_sub = DST / f"root_sub_{name}"
+            if btrfs_clone_subvol(SRC / "root_top", name, DST / "root_top"):
+                mnt("-t", "btrfs", "-o", f"subvol={name},noatime", root_dev, dst_sub)
+                return
+            sh(["btrfs", "subvolume", "create", str(DST / "root_top" / name)])
+            mnt("-t", "btrfs", "-o", f"subvol={name},noatime", root_dev, dst_sub)
+            desc = f"Copying Fedora btrfs subvol: {name}"
+            if log is None:
+                rsync_progress(SRC / f"root_sub_{name}", dst_sub, desc)
+            else:
+                rsync_logged(SRC / f"root_sub_{name}", dst_sub, desc, log)
 
-        # mount them for rsync targets
-        sh(["mount", "-t", "btrfs", "-o", "subvol=root", root_dev, str(DST / "root_sub_root")])
-        if has_home:
-            sh(["mount", "-t", "btrfs", "-o", "subvol=home", root_dev, str(DST / "root_sub_home")])
-        if has_var:
-            sh(["mount", "-t", "btrfs", "-o", "subvol=var", root_dev, str(DST / "root_sub_var")])
+        subvol_names = ["root"] + (["home"] if has_home else []) + (["var"] if has_var else [])
+        if len(subvol_names) == 1:
+            clone_subvol("root")
+        else:
+            # independent subvols: overlap them; a progress bar per job would scramble stdout, so log to files
+            with ThreadPoolExecutor(max_workers=len(subvol_names)) as ex:
+                futs = [ex.submit(clone_subvol, n, Path(f"/tmp/mash-clone-{n}.log")) for n in subvol_names]
+                for f in futs:
+                    f.result()
 
-        # ---- copy root subvols ----
-        rsync_progress(SRC / "root_sub_root", DST / "root_sub_root", "Copying Fedora btrfs subvol: root")
-        if has_home:
-            rsync_progress(SRC / "root_sub_home", DST / "root_sub_home", "Copying Fedora btrfs subvol: home")
-        if has_var:
-            rsync_progress(SRC / "root_sub_var", DST / "root_sub_var", "Copying Fedora btrfs subvol: var")
+        # clone done: back to the default 30s commit interval for the chroot/dracut phase
+        sh(["mount", "-o", "remount,commit=30", str(DST / "root_top")])
 
         # ---- copy /boot partition ----
-        rsync_progress(SRC / "boot", DST / "boot", "Copying Fedora /boot partition -> real /boot (ext4)")
+        banner("Copying Fedora /boot partition -> real /boot (ext4)")
+        fast_copytree(SRC / "boot", DST / "boot")
+        print("✅ Done.")
 
         # ---- mount /boot and /boot/efi into the target root subvol ----
         banner("Mounting /boot and /boot/efi inside target root")
@@ -429,19 +679,21 @@ def main():
         mkdirp(DST / "root_sub_root" / "boot" / "efi")
 
         # bind /boot ext4 into root
-        sh(["mount", "--bind", str(DST / "boot"), str(DST / "root_sub_root" / "boot")])
+        mnt("--bind", DST / "boot", DST / "root_sub_root" / "boot")
         # mount EFI into /boot/efi inside root
-        sh(["mount", "--bind", str(DST / "efi"), str(DST / "root_sub_root" / "boot" / "efi")])
-
-        # ---- install Fedora EFI loaders onto EFI ----
-        banner("Installing Fedora EFI loaders (EFI/*) onto EFI (FAT32)")
-        mkdirp(DST / "efi" / "EFI")
-        rsync_vfat_safe(SRC / "efi" / "EFI", DST / "efi" / "EFI", "Copy Fedora EFI tree to EFI partition")
+        mnt("--bind", DST / "efi", DST / "root_sub_root" / "boot" / "efi")
 
-        # ---- install PFTF UEFI onto EFI (LAST) ----
-        banner("Installing Pi4 UEFI (PFTF) onto EFI (LAST)")
-        # copy PFTF directory contents onto the EFI partition
-        rsync_vfat_safe(uefi_dir, DST / "efi", "Copy PFTF UEFI firmware to EFI partition")
+        # ---- install Fedora EFI loaders + PFTF UEFI onto EFI ----
+        # merge both trees on tmpfs first (PFTF last, so it wins on conflicts),
+        # then write FAT32 once instead of two passes of directory/FAT updates
+        banner("Installing Fedora EFI loaders (EFI/*) + Pi4 UEFI (PFTF) onto EFI (FAT32)")
+        stage = Path(tempfile.mkdtemp(prefix="mash-efi-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None))
+        try:
+            shutil.copytree(SRC / "efi" / "EFI", stage / "EFI", dirs_exist_ok=True)
+            shutil.copytree(uefi_dir, stage, dirs_exist_ok=True)
+            rsync_vfat_safe(stage, DST / "efi", "Copy merged Fedora EFI + PFTF tree to EFI partition")
+        finally:
+            shutil.rmtree(stage, ignore_errors=True)
 
         # ---- write config.txt (PFTF known-good) ----
         banner("Writing Pi4 UEFI config.txt")
@@ -463,9 +715,9 @@ dtoverlay=upstream-pi4
 
         # ---- fstab ----
         banner("Writing UUID-based /etc/fstab")
-        efi_uuid = blkid_uuid(efi_dev)
-        boot_uuid = blkid_uuid(boot_dev)
-        root_uuid = blkid_uuid(root_dev)
+        efi_uuid = uuids.get(efi_dev) or blkid_uuid(efi_dev)
+        boot_uuid = uuids.get(boot_dev) or blkid_uuid(boot_dev)
+        root_uuid = uuids.get(root_dev) or blkid_uuid(root_dev)
 
         fstab_lines = [
             f"UUID={root_uuid}  /         btrfs  subvol=root,compress=zstd:1,defaults,noatime  0 0",
@@ -475,7 +727,7 @@ dtoverlay=upstream-pi4
             f"UUID={efi_uuid}   /boot/efi vfat   umask=0077,shortname=winnt  0 2",
         ]
         if data_dev:
-            data_uuid = blkid_uuid(data_dev)
+            data_uuid = uuids.get(data_dev) or blkid_uuid(data_dev)
             fstab_lines.append(f"UUID={data_uuid}  /data     ext4   defaults,noatime  0 2")
 
         # write into target root
@@ -492,30 +744,36 @@ dtoverlay=upstream-pi4
         if not args.no_dracut:
             banner("Bind mounts for chroot + fixing /var/tmp + devpts")
             # Ensure required dirs exist inside target root
-            mkdirp(DST / "root_sub_root" / "dev")
-            mkdirp(DST / "root_sub_root" / "dev" / "pts")
-            mkdirp(DST / "root_sub_root" / "proc")
-            mkdirp(DST / "root_sub_root" / "sys")
-            mkdirp(DST / "root_sub_root" / "run")
-            mkdirp(DST / "root_sub_root" / "tmp")
-            mkdirp(DST / "root_sub_root" / "var" / "tmp")
+            for sub in ["dev/pts", "proc", "sys", "run", "tmp", "var/tmp"]:
+                mkdirp(DST / "root_sub_root" / sub)
 
             # chmod sticky bits for tmp dirs
-            sh(["chmod", "1777", str(DST / "root_sub_root" / "tmp")], check=False)
-            sh(["chmod", "1777", str(DST / "root_sub_root" / "var" / "tmp")], check=False)
+            sh(["chmod", "1777", str(DST / "root_sub_root" / "tmp")], check=False, quiet=True)
+            sh(["chmod", "1777", str(DST / "root_sub_root" / "var" / "tmp")], check=False, quiet=True)
 
             # bind mounts
-            sh(["mount", "--bind", "/dev", str(DST / "root_sub_root" / "dev")])
-            sh(["mount", "-t", "devpts", "devpts", str(DST / "root_sub_root" / "dev" / "pts")], check=False)
-            sh(["mount", "--bind", "/proc", str(DST / "root_sub_root" / "proc")])
-            sh(["mount", "--bind", "/sys", str(DST / "root_sub_root" / "sys")])
-            sh(["mount", "--bind", "/run", str(DST / "root_sub_root" / "run")], check=False)
-            sh(["mount", "--bind", "/tmp", str(DST / "root_sub_root" / "tmp")], check=False)
-
-            banner("Running dracut in chroot (regenerate all)")
+            mnt("--bind", "/dev", DST / "root_sub_root" / "dev")
+            mnt("-t", "devpts", "devpts", DST / "root_sub_root" / "dev" / "pts", check=False)
+            mnt("--bind", "/proc", DST / "root_sub_root" / "proc")
+            mnt("--bind", "/sys", DST / "root_sub_root" / "sys")
+            mnt("--bind", "/run", DST / "root_sub_root" / "run", check=False)
+            mnt("--bind", "/tmp", DST / "root_sub_root" / "tmp", check=False)
+
+            banner("Running dracut in chroot (one build per installed kernel)")
             # IMPORTANT: /boot and /boot/efi are already bind-mounted above
-            # Use --regenerate-all --force
-            sh(["chroot", str(DST / "root_sub_root"), "dracut", "--regenerate-all", "--force"], check=False)
+            target_root = str(DST / "root_sub_root")
+            modules_dir = DST / "root_sub_root" / "lib" / "modules"
+            kvers = sorted(os.listdir(modules_dir)) if modules_dir.is_dir() else []
+            if kvers:
+                # dracut's own --parallel only applies to --regenerate-all (dracut >= 059); per-kernel
+                # --kver builds are fanned out here so an older dracut in the target image still overlaps them
+                with ThreadPoolExecutor(max_workers=min(4, len(kvers))) as ex:
+                    futs = [ex.submit(sh, ["chroot", target_root, "dracut", "--force", "--kver", k], check=False)
+                            for k in kvers]
+                    for f in futs:
+                        f.result()
+            else:
+                sh(["chroot", target_root, "dracut", "--regenerate-all", "--force"], check=False)
 
         # ---- final sanity ----
         banner("Final sanity checks")